@@ -0,0 +1,72 @@
+"""Synthetic charms for the benchmarks.
+
+``jinx_source(n)`` is a Jinx with ``n`` declarations, split evenly between
+relations, config options and actions, every relation and action with an
+observer; ``plain_source(n)`` is the same charm written against plain ops.
+"""
+import sys
+from types import ModuleType
+from typing import Tuple
+
+SCALES = (10, 100, 1000)
+
+
+def split(n: int) -> Tuple[int, int, int]:
+    """Number of (relations, configs, actions) in a charm of scale n."""
+    third = n // 3
+    return n - 2 * third, third, third
+
+
+def jinx_source(n: int, name: str = 'BenchJinx') -> str:
+    relations, configs, actions = split(n)
+    lines = ['from jinx import *', '', '',
+             f'class {name}(Jinx):',
+             f"    name = 'bench-{n}'", '']
+    for i in range(relations):
+        lines.append(f"    rel_{i} = require(interface='iface-{i}', "
+                     f"name='rel-{i}')")
+    for i in range(configs):
+        lines.append(f"    opt_{i} = config(string('option {i}', "
+                     f"default='value-{i}'))")
+    for i in range(actions):
+        lines.append(f"    act_{i} = action({{'param': string('p')}}, "
+                     f"name='act-{i}')")
+    for i in range(relations):
+        lines += ['', f'    @rel_{i}.on_changed',
+                  f'    def _on_rel_{i}_changed(self, event):',
+                  '        pass']
+    for i in range(actions):
+        lines += ['', f'    @act_{i}.handler',
+                  f'    def _on_act_{i}(self, event):',
+                  "        return {'done': 'yes'}"]
+    return '\n'.join(lines) + '\n'
+
+
+def plain_source(n: int, name: str = 'BenchCharm') -> str:
+    relations, configs, actions = split(n)
+    observes = [f'self.framework.observe(self.on.rel_{i}_relation_changed, '
+                f'self._on_rel_{i}_changed)' for i in range(relations)]
+    observes += [f'self.framework.observe(self.on.act_{i}_action, '
+                 f'self._on_act_{i})' for i in range(actions)]
+    lines = ['from ops.charm import CharmBase', '', '',
+             f'class {name}(CharmBase):',
+             '    def __init__(self, framework, key=None):',
+             '        super().__init__(framework, key)']
+    lines += ['        ' + line for line in observes] or ['        pass']
+    for i in range(relations):
+        lines += ['', f'    def _on_rel_{i}_changed(self, event):',
+                  '        pass']
+    for i in range(actions):
+        lines += ['', f'    def _on_act_{i}(self, event):',
+                  "        event.set_results({'done': 'yes'})"]
+    return '\n'.join(lines) + '\n'
+
+
+def load(source: str, name: str, module: str = 'bench_charm') -> type:
+    """Execute ``source`` in a fresh module and return its class ``name``."""
+    mod = ModuleType(module)
+    # Harness looks the charm's module up to find the charm dir
+    mod.__file__ = __file__
+    sys.modules[module] = mod
+    exec(compile(source, f'<{module}>', 'exec'), mod.__dict__)
+    return mod.__dict__[name]
@@ -0,0 +1,228 @@
+"""Time jinx against plain ops on synthetic charms; see charms.py.
+
+Run from the repository root::
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline results.json  # compare to a run
+
+Each benchmark is timed at every scale; the best of ``repeat`` runs is
+reported, per call or, for the access benchmarks, per attribute read.
+"""
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import timeit
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import ops
+import yaml
+from ops.testing import Harness
+
+from jinx import Serializer, harness
+from unpack import unpack
+from benchmarks.charms import SCALES, jinx_source, load, plain_source
+
+# a benchmark factory does its setup and returns the timed callable plus
+# the number of operations one call performs
+Setup = Callable[[int, Path], Tuple[Callable[[], Any], int]]
+BENCHMARKS: Dict[str, Setup] = {}
+
+
+def benchmark(name: str) -> Callable[[Setup], Setup]:
+    def register(setup: Setup) -> Setup:
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@dataclass
+class Result:
+    name: str
+    scale: int
+    seconds: float  # best time per operation
+    number: int  # calls per timed run
+    ops: int  # operations per call
+
+
+def _jinx(n: int):
+    return load(jinx_source(n), 'BenchJinx')
+
+
+def _begun(n: int):
+    h = harness(_jinx(n))
+    h.begin()
+    return h
+
+
+@benchmark('class_creation')
+def _class_creation(n, _tmp):
+    code = compile(jinx_source(n), '<bench>', 'exec')
+    return lambda: exec(code, {}), 1
+
+
+@benchmark('harness_begin/jinx')
+def _harness_begin_jinx(n, _tmp):
+    jinx = _jinx(n)
+
+    def begin():
+        h = harness(jinx)
+        h.begin()
+        h.cleanup()
+    return begin, 1
+
+
+@benchmark('harness_begin/plain')
+def _harness_begin_plain(n, _tmp):
+    charm = load(plain_source(n), 'BenchCharm', 'bench_plain_charm')
+    serializer = Serializer(_jinx(n))
+    meta = yaml.safe_dump(serializer.metadata)
+    actions = yaml.safe_dump(serializer.actions)
+    config = yaml.safe_dump(serializer.config)
+
+    def begin():
+        h = Harness(charm, meta=meta, actions=actions, config=config)
+        h.begin()
+        h.cleanup()
+    return begin, 1
+
+
+def _access(n: int, prefix: str):
+    charm = _begun(n).charm
+    attrs = [a for a in type(charm).__jinx_registry__.index
+             if a.startswith(prefix)]
+
+    def read():
+        for attr in attrs:
+            getattr(charm, attr)
+    return charm, read, len(attrs)
+
+
+@benchmark('relation_access')
+def _relation_access(n, _tmp):
+    _, read, count = _access(n, 'rel_')
+    return read, count
+
+
+@benchmark('config_access')
+def _config_access(n, _tmp):
+    _, read, count = _access(n, 'opt_')
+    return read, count
+
+
+@benchmark('config_access/first')
+def _config_access_first(n, _tmp):
+    """Config reads right after a config change, snapshot included."""
+    charm, read, count = _access(n, 'opt_')
+
+    def reload():
+        charm._config_snapshot = None
+        read()
+    return reload, count
+
+
+def _section(section: str) -> Setup:
+    def setup(n, _tmp):
+        jinx = _jinx(n)
+
+        def serialize():
+            Serializer.invalidate(jinx)
+            getattr(Serializer(jinx), section)
+        return serialize, 1
+    return setup
+
+
+for _name in ('metadata', 'actions', 'config', 'charmcraft', 'charm_meta'):
+    benchmark(f'serializer/{_name}')(_section(_name))
+
+
+def _unpack(incremental: bool) -> Setup:
+    def setup(n, tmp):
+        path = tmp / 'jinx.py'
+        path.write_text(jinx_source(n))
+        root = tmp / 'charm'
+        root.mkdir()
+        return lambda: unpack(path, root, overwrite=True,
+                              incremental=incremental), 1
+    return setup
+
+
+benchmark('unpack')(_unpack(False))
+benchmark('unpack/incremental')(_unpack(True))
+
+
+def run(scales: Sequence[int] = SCALES, repeat: int = 5,
+        only: Optional[str] = None) -> List[Result]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, setup in BENCHMARKS.items():
+            if only and only not in name:
+                continue
+            for n in scales:
+                func, count = setup(n, Path(tempfile.mkdtemp(dir=tmp)))
+                timer = timeit.Timer(func)
+                number, _ = timer.autorange()
+                best = min(timer.repeat(repeat, number)) / number
+                results.append(Result(name, n, best / count, number, count))
+                print(f'{name:<24} {n:>5} {best / count * 1e6:>12.2f} us',
+                      file=sys.stderr)
+    return results
+
+
+def dump(results: List[Result]) -> Dict[str, Any]:
+    return {'python': platform.python_version(),
+            'ops': ops.__version__,
+            'timestamp': time.time(),
+            'results': [asdict(r) for r in results]}
+
+
+def compare(results: List[Result], baseline: Dict[str, Any],
+            tolerance: float) -> List[str]:
+    """Lines describing the benchmarks slower than baseline * (1+tolerance)."""
+    before = {(r['name'], r['scale']): r['seconds']
+              for r in baseline['results']}
+    slower = []
+    for r in results:
+        old = before.get((r.name, r.scale))
+        if old and r.seconds > old * (1 + tolerance):
+            slower.append(f'{r.name} [{r.scale}]: {old * 1e6:.2f}us -> '
+                          f'{r.seconds * 1e6:.2f}us')
+    return slower
+
+
+if __name__ == '__main__':
+    from typer import Exit, Option, run as typer_run
+
+    def _run(
+            scales: str = Option(
+                ','.join(map(str, SCALES)),
+                help='comma-separated number of declarations per charm.'),
+            repeat: int = Option(5, help='timed runs per benchmark; '
+                                         'the best one is reported.'),
+            only: Optional[str] = Option(
+                None, help='only run benchmarks whose name contains this.'),
+            output: Optional[Path] = Option(
+                None, help='write the results as JSON to this file.'),
+            baseline: Optional[Path] = Option(
+                None, help='JSON results of an earlier run to compare to; '
+                           'exits 1 on a regression.'),
+            tolerance: float = Option(
+                0.25, help='slowdown relative to --baseline tolerated '
+                           'before reporting a regression.')):
+        os.environ.pop('JUJU_DISPATCH_PATH', None)
+        results = run([int(s) for s in scales.split(',')], repeat, only)
+        if output:
+            output.write_text(json.dumps(dump(results), indent=2))
+        if baseline:
+            slower = compare(results, json.loads(baseline.read_text()),
+                             tolerance)
+            if slower:
+                print('regressions:\n' + '\n'.join(slower))
+                raise Exit(1)
+            print('no regressions')
+
+    typer_run(_run)
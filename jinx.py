@@ -1,8 +1,20 @@
+from __future__ import annotations
+
 import functools
 import logging
+from collections.abc import MutableMapping
 from abc import abstractmethod, ABCMeta
-from dataclasses import dataclass, asdict
-from typing import Dict, TypeVar, Optional, Callable, Union, List, Generic
+import dataclasses
+from dataclasses import FrozenInstanceError
+import inspect
+import os
+import sys
+import weakref
+from time import perf_counter
+from types import FunctionType, MappingProxyType, MethodType
+from typing import (Any, Awaitable, Dict, FrozenSet, TypeVar, Optional,
+                    Callable, Union, List, Generic, Iterable, Mapping,
+                    Sequence, Tuple)
 
 try:
     from typing import Literal, overload, TYPE_CHECKING, Type
@@ -11,27 +23,189 @@ except (ModuleNotFoundError, ImportError):
 
 import ops
 from ops.charm import *
-from ops.framework import Framework, EventSource
-from ops.model import ConfigData
+from ops.framework import BoundEvent, Framework, EventSource
+from ops.jujuversion import JujuVersion
+from ops.model import (Application, ConfigData, Container, ModelError,
+                       Relation, RelationDataContent, RelationDataError,
+                       RelationNotFoundError, Unit)
 
 Arch = Literal['amd64']
 logger = logging.getLogger('jinx')
+T = TypeVar("T")
 
 
-@dataclass
-class Platform:
+class _FrozenDict(dict):
+    """A read-only, hashable dict."""
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f'{type(self).__name__} is read-only')
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __hash__(self):
+        return hash(frozenset(self.items()))
+
+    def __reduce__(self):
+        return _FrozenDict, (dict(self),)
+
+
+def _dataclass_field(name: str, type_: Any, default: Any) -> Any:
+    """The ``dataclasses.Field`` ``dataclass()`` would make for ``name``."""
+    f = dataclasses.field(default=default)
+    f.name, f.type = name, type_
+    f._field_type = dataclasses._FIELD
+    if hasattr(f, 'kw_only'):  # python 3.10+
+        f.kw_only = False
+    return f
+
+
+class _ValueMeta(type):
+    """Builds value classes in one go: the annotated fields become
+    ``__slots__`` and their class-level values become the defaults.
+
+    The classes are also described as frozen dataclasses, the way
+    ``dataclass()`` would, so ``fields()`` and ``asdict()`` work on them.
+    """
+    _params = None  # dataclass parameters, shared by all value classes
+
+    def __new__(mcs, name, bases, namespace):
+        annotations = namespace.get('__annotations__', {})
+        own = tuple(annotations)
+        fields_, defaults, dc_fields = (), {}, {}
+        for base in bases:
+            fields_ += getattr(base, '_fields', ())
+            defaults.update(getattr(base, '_defaults', {}))
+            dc_fields.update(getattr(base, '__dataclass_fields__', {}))
+        defaults.update((f, namespace.pop(f)) for f in own if f in namespace)
+        dc_fields.update(
+            (f, _dataclass_field(f, annotations[f],
+                                 defaults.get(f, dataclasses.MISSING)))
+            for f in own)
+        if mcs._params is None:
+            mcs._params = dataclasses.dataclass(frozen=True)(
+                type('_Params', (), {})).__dataclass_params__
+        namespace.setdefault('__slots__', own)
+        namespace.update(_fields=fields_ + own, _defaults=defaults,
+                         __dataclass_fields__=dc_fields,
+                         __dataclass_params__=mcs._params)
+        return super().__new__(mcs, name, bases, namespace)
+
+
+class _Value(metaclass=_ValueMeta):
+    """A frozen, hashable, slotted record of its annotated fields.
+
+    ``to_dict()`` returns the fields as a dict, nested values included (or
+    what the class' ``_serialize`` returns), computed on first use and
+    shared afterwards: callers must not mutate it.
+    """
+    __slots__ = ('_dict', '__weakref__')
+
+    def __init__(self, *args, **kwargs):
+        if len(args) > len(self._fields):
+            raise TypeError(f'{type(self).__name__} takes at most '
+                            f'{len(self._fields)} arguments')
+        values = dict(zip(self._fields, args))
+        for key, value in kwargs.items():
+            if key not in self._fields or key in values:
+                raise TypeError(f'{type(self).__name__} got an unexpected '
+                                f'or repeated argument {key!r}')
+            values[key] = value
+        for f in self._fields:
+            try:
+                value = values[f] if f in values else self._defaults[f]
+            except KeyError:
+                raise TypeError(f'{type(self).__name__} missing argument '
+                                f'{f!r}') from None
+            object.__setattr__(self, f, value)
+        self.__post_init__()
+
+    def __post_init__(self):
+        pass
+
+    def __setattr__(self, key, value):
+        raise FrozenInstanceError(f'cannot assign to field {key!r}')
+
+    def __delattr__(self, key):
+        raise FrozenInstanceError(f'cannot delete field {key!r}')
+
+    def __getstate__(self):
+        return tuple(getattr(self, f) for f in self._fields)
+
+    def __setstate__(self, state):
+        for f, value in zip(self._fields, state):
+            object.__setattr__(self, f, value)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.__getstate__() == other.__getstate__()
+
+    def __hash__(self):
+        return hash((type(self), self.__getstate__()))
+
+    def __repr__(self):
+        return f'{type(self).__name__}(' + ', '.join(
+            f'{f}={getattr(self, f)!r}' for f in self._fields) + ')'
+
+    def _serialize(self) -> Dict[str, Any]:
+        return {f: value.to_dict() if isinstance(value, _Value) else value
+                for f, value in zip(self._fields, self.__getstate__())}
+
+    def to_dict(self) -> Dict[str, Any]:
+        try:
+            return self._dict
+        except AttributeError:
+            dct = self._serialize()
+            object.__setattr__(self, '_dict', dct)
+            return dct
+
+
+# fully typed state (see _typed) -> the canonical value object
+_INTERNED: 'weakref.WeakValueDictionary[tuple, Any]' = \
+    weakref.WeakValueDictionary()
+
+
+def _typed(value: Any) -> Any:
+    """``value`` as a hashable key that tells apart, at any depth, values
+    that compare equal but serialize differently (``1`` and ``1.0``)."""
+    if isinstance(value, _Value):
+        return type(value), tuple(map(_typed, value.__getstate__()))
+    if isinstance(value, Mapping):
+        return type(value), tuple((k, _typed(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(map(_typed, value))
+    return type(value), value
+
+
+def _intern(value: T) -> T:
+    """The one live instance equal to ``value``, so charms can share it."""
+    try:
+        return _INTERNED.setdefault(_typed(value), value)
+    except TypeError:  # an unhashable field value
+        return value
+
+
+class Platform(_Value):
+    """An os name and channel a charm is built or run on."""
     name: str = 'ubuntu'
     channel: str = '20.04'
 
 
-@dataclass
-class Base:
-    run_on: List[Platform]
-    build_on: List[Platform]
+class Base(_Value):
+    """A charmcraft.yaml base."""
+    run_on: Tuple[Platform, ...]
+    build_on: Tuple[Platform, ...]
 
-    def to_dict(self):
-        return {'run-on': [asdict(b) for b in self.run_on],
-                'build-on': [asdict(b) for b in self.build_on]}
+    def __post_init__(self):
+        # accept lists, as documented; store them hashable
+        object.__setattr__(self, 'run_on', tuple(self.run_on))
+        object.__setattr__(self, 'build_on', tuple(self.build_on))
+
+    def _serialize(self):
+        return {'run-on': [b.to_dict() for b in self.run_on],
+                'build-on': [b.to_dict() for b in self.build_on]}
 
 
 RelationName = ResourceName = StorageName = ContainerName = ActionName = str
@@ -41,19 +215,26 @@ def _sanitize(s: str) -> str:
     return s.replace('-', '_')
 
 
-@dataclass
-class InterfaceMeta:
+class InterfaceMeta(_Value):
+    """Metadata of a relation endpoint."""
     interface: str
+    schema: Optional['DatabagSchema'] = None
 
+    def _serialize(self):
+        dct = {'interface': self.interface}
+        if self.schema is not None:
+            dct['schema'] = self.schema.to_dict()
+        return dct
 
-@dataclass
-class RelationMeta:
+
+class RelationMeta(_Value):
+    """A named relation endpoint."""
     name: str
     interface: InterfaceMeta
 
 
-@dataclass
-class _Param:
+class _Param(_Value):
+    """A config option or action parameter."""
     type: Literal['string', 'integer', 'float']
     description: str = ''
     default: Union[str, int, float] = None
@@ -79,7 +260,7 @@ def Param(type: Literal['string', 'float', 'integer'],
           description: str = '',
           default: Optional[Union[str, float, int]] = None
           ) -> _Param:
-    return _Param(type, description, default)
+    return _intern(_Param(type, description, default))
 
 
 # fmt: on
@@ -98,8 +279,11 @@ def float_(description: str = '', default: float = None) -> _Param:
 
 
 class LateBoundNamed:
+    __slots__ = ('_name', '_attr')
+
     def __init__(self, name: Optional[str]):
         self._name = name  # set by .bind() later if None
+        self._attr = None  # set by __set_name__ if assigned in a class body
 
     @property
     def name(self):
@@ -112,23 +296,203 @@ class LateBoundNamed:
         if not self._name:
             self._name = name
 
+    def __set_name__(self, owner, attr):
+        # allow defaulting name to the attr they are assigned to
+        self._attr = attr
+        self.bind(attr)
+
+    def _cache(self, obj, bound_type: Type['_Bound']) -> '_Bound':
+        """Bind to ``obj``, caching the view in the instance dict.
+
+        The view shadows this descriptor: subsequent lookups of the attribute
+        on ``obj`` are plain attribute reads; a new charm instance (e.g. a
+        Harness re-begin) starts empty.
+        """
+        profile = getattr(obj, '_profile', None)
+        start = perf_counter() if profile else 0
+        bound = bound_type(self, obj)
+        if self._attr is not None:
+            obj.__dict__[self._attr] = bound
+        if profile:
+            profile.add('descriptor', self._attr or self.name,
+                        perf_counter() - start)
+        return bound
+
 
 class _Config(LateBoundNamed):
+    __slots__ = ('var',)
+
     def __init__(self, name: Optional[str], var: _Param):
         super().__init__(name)
         self.var = var
 
     def __get__(self, instance, owner: 'Jinx'):
-        return instance.config[self.name]
+        if instance is None:
+            return self
+        if self._attr is None:
+            # not declared in a class body: no slot in the snapshot
+            return instance.config[self.name]
+        snapshot = instance._config_snapshot
+        if snapshot is None:
+            snapshot = instance._load_config_snapshot()
+        try:
+            return getattr(snapshot, self._attr)
+        except AttributeError:
+            raise KeyError(self.name) from None
+
+
+_COERCE = {'string': str, 'integer': int, 'float': float}
+
 
+class _ConfigSnapshot:
+    """Typed config values of a charm, read once per hook.
 
-@dataclass
-class ActionMeta:
-    params: Dict[str, _Param]
+    Each Jinx class gets a subclass with one slot per config attribute;
+    options without a value leave their slot empty.
+    """
+    __slots__ = ()
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def type_for(attrs: Tuple[str, ...]) -> Type['_ConfigSnapshot']:
+        return type('ConfigSnapshot', (_ConfigSnapshot,), {'__slots__': attrs})
+
+    @staticmethod
+    def load(configs: Tuple[Tuple[str, _Config], ...],
+             data: Mapping[str, Any]) -> '_ConfigSnapshot':
+        snapshot = _ConfigSnapshot.type_for(tuple(a for a, _ in configs))()
+        for attr, conf in configs:
+            try:
+                value = data[conf.name]
+            except KeyError:
+                continue
+            if value is not None:
+                value = _COERCE[conf.var.type](value)
+            setattr(snapshot, attr, value)
+        return snapshot
+
+
+class DatabagSchema(_Value):
+    """Fields of the app and unit databags of a relation."""
+    app: Optional[Mapping[str, _Param]] = None
+    unit: Optional[Mapping[str, _Param]] = None
+
+    def __post_init__(self):
+        for bag in ('app', 'unit'):
+            fields_ = getattr(self, bag)
+            if fields_ is not None:
+                for key in fields_:
+                    if not _sanitize(key).isidentifier():
+                        raise TypeError(f'invalid databag field name {key!r}')
+                object.__setattr__(self, bag, _FrozenDict(fields_))
+
+    def _serialize(self):
+        return {bag: {key: param.to_dict() for key, param in fields_.items()}
+                for bag, fields_ in (('app', self.app), ('unit', self.unit))
+                if fields_ is not None}
+
+
+class _Record:
+    """A decoded databag: one slot per schema field, named like it with
+    dashes replaced by underscores. Absent fields hold their default."""
+    __slots__ = ()
+
+    def _asdict(self) -> Dict[str, Any]:
+        return {attr: getattr(self, attr) for attr in self.__slots__}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self._asdict() == other._asdict()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self._asdict()})'
+
+
+class _Codec:
+    """Databag decoder and encoder for a schema, compiled once per schema."""
+    __slots__ = ('record_type', 'decode', 'encode')
+
+    _ENCODE = {
+        'string': 'value if isinstance(value, str) else _bad()',
+        'integer': 'str(value) if isinstance(value, int) '
+                   'and not isinstance(value, bool) else _bad()',
+        'float': 'repr(float(value)) if isinstance(value, (int, float)) '
+                 'and not isinstance(value, bool) else _bad()'}
+
+    def __init__(self, fields_: Mapping[str, _Param]):
+        attrs = {key: _sanitize(key) for key in fields_}
+        self.record_type = type('Record', (_Record,),
+                                {'__slots__': tuple(attrs.values())})
+        namespace = {'Record': self.record_type,
+                     'RelationDataError': RelationDataError}
+        decode = ['def decode(data):', '    get = data.get',
+                  '    record = Record()']
+        encode = ['def encode(values):', '    get = values.get',
+                  '    data = {}']
+        for i, (key, param) in enumerate(fields_.items()):
+            attr = attrs[key]
+            namespace[f'default_{i}'] = (
+                None if param.default is None
+                else _COERCE[param.type](param.default))
+            decode += [f'    value = get({key!r})',
+                       '    if value is None:',
+                       f'        record.{attr} = default_{i}']
+            if param.type == 'string':
+                decode += ['    else:',
+                           f'        record.{attr} = value']
+            else:
+                decode += [
+                    '    else:',
+                    '        try:',
+                    f'            record.{attr} = '
+                    f'{_COERCE[param.type].__name__}(value)',
+                    '        except ValueError:',
+                    '            raise RelationDataError(',
+                    f'                f"{key}: invalid {param.type}: '
+                    '{value!r}") from None']
+            encode += [
+                f'    value = get({attr!r})',
+                '    if value is None:',
+                f'        if {attr!r} in values:',
+                f"            data[{key!r}] = ''",
+                '    else:',
+                '        try:',
+                f'            data[{key!r}] = {self._ENCODE[param.type]}',
+                '        except (TypeError, ValueError):',
+                '            raise RelationDataError(',
+                f'                f"{key}: invalid {param.type}: '
+                '{value!r}") from None']
+        decode.append('    return record')
+        encode.append('    return data')
+        namespace['_bad'] = _raise_type_error
+        exec('\n'.join(decode + [''] + encode), namespace)
+        self.decode: Callable[[Mapping[str, str]], _Record] = \
+            namespace['decode']
+        self.encode: Callable[[Mapping[str, Any]], Dict[str, str]] = \
+            namespace['encode']
 
-@dataclass
-class FSStorageSpec:
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def of(fields_: Mapping[str, _Param]) -> '_Codec':
+        return _Codec(fields_)
+
+
+def _raise_type_error():
+    raise TypeError()
+
+
+class ActionMeta(_Value):
+    """Metadata of an action."""
+    params: Mapping[str, _Param]
+
+    def __post_init__(self):
+        object.__setattr__(self, 'params', _FrozenDict(self.params))
+
+    def _serialize(self):
+        return {'params': {k: v.to_dict() for k, v in self.params.items()}}
+
+
+class FSStorageSpec(_Value):
+    """Metadata of a storage."""
     type: str
     location: Optional[str] = None
 
@@ -136,18 +500,18 @@ class FSStorageSpec:
 StorageSpec = Union[FSStorageSpec]
 
 
-@dataclass
-class ContainerSpec:
+class ContainerSpec(_Value):
+    """Metadata of a container."""
     resource: ResourceName
 
 
-@dataclass
-class ResourceSpec:
+class ResourceSpec(_Value):
+    """Metadata of a resource."""
     type: str = 'oci-image'
     description: str = ''
     upstream_source: str = ''
 
-    def to_dict(self):
+    def _serialize(self):
         dct = {'type': self.type}
         if self.description:
             dct['description'] = self.description
@@ -156,7 +520,238 @@ class ResourceSpec:
         return dct
 
 
-T = TypeVar("T")
+
+class _Registry:
+    """Immutable index of the declarations of a Jinx class.
+
+    Built once per class from the parents' registries plus the class' own
+    namespace, so class creation never rescans the whole MRO.
+    """
+    __slots__ = ('index', 'handlers', 'observed', 'observers', 'relations',
+                 'containers', 'storages', 'resources', 'actions', 'configs')
+
+    def __init__(self, index: Dict[str, LateBoundNamed],
+                 handlers: Dict[str, '_Action'],
+                 observed: Dict[str, Tuple[str, ...]]):
+        # attr name -> declaration, in declaration order
+        self.index = MappingProxyType(index)
+        # attr name of an action handler -> the action it handles
+        self.handlers = MappingProxyType(handlers)
+        # attr name of a decorated observer -> event kinds it observes
+        self.observed = MappingProxyType(observed)
+        # (method attr name, event kind on charm.on) pairs wired at __init__
+        self.observers = tuple(
+            (attr, kind) for attr, kinds in observed.items()
+            for kind in kinds) + tuple(
+            (attr, f'{_sanitize(action.name)}_action')
+            for attr, action in handlers.items())
+
+        decls = index.items()
+        self.relations = tuple(o for _, o in decls if isinstance(o, _Relation))
+        self.containers = tuple(
+            o for _, o in decls if isinstance(o, _Container))
+        self.storages = tuple(o for _, o in decls if isinstance(o, _Storage))
+        self.resources = tuple(o for _, o in decls if isinstance(o, _Resource))
+        self.actions = tuple(o for _, o in decls if isinstance(o, _Action))
+        self.configs = tuple((n, o) for n, o in decls if isinstance(o, _Config))
+
+    @staticmethod
+    def of(cls: type) -> '_Registry':
+        """The registry of a class; plain (non-Jinx) mixins are scanned."""
+        registry = vars(cls).get('__jinx_registry__')
+        if registry is None:
+            if cls is object:
+                return _EMPTY_REGISTRY
+            registry = _Registry.build(cls.__bases__, vars(cls))
+        return registry
+
+    @staticmethod
+    def build(bases, namespace,
+              precomputed: Optional[Mapping[str, Tuple[str, ...]]] = None
+              ) -> '_Registry':
+        """``precomputed`` maps observer attrs to their event kinds, as
+        recorded in a bundle; their signatures were checked back then."""
+        precomputed = precomputed or {}
+        index = {}
+        handlers = {}
+        observed = {}
+        # earlier bases take precedence, as in the MRO
+        for base in reversed(bases):
+            parent = _Registry.of(base)
+            index.update(parent.index)
+            handlers.update(parent.handlers)
+            observed.update(parent.observed)
+
+        for attr, obj in namespace.items():
+            if isinstance(obj, LateBoundNamed):
+                index[attr] = obj
+            else:
+                # overriding a declaration with something else hides it
+                index.pop(attr, None)
+
+            # an override drops the wiring of the method it replaces
+            handlers.pop(attr, None)
+            observed.pop(attr, None)
+            if not isinstance(obj, FunctionType):
+                continue
+            action = getattr(obj, '__action__', None)
+            marks = getattr(obj, '__observes__', None)
+            kinds = precomputed.get(attr)
+            if kinds is None and (marks or isinstance(action, _Action)):
+                _check_observer(obj)
+            if isinstance(action, _Action):
+                handlers[attr] = action
+            if marks:
+                observed[attr] = kinds or tuple(
+                    kind if decl is None else f'{_sanitize(decl.name)}_{kind}'
+                    for decl, kind in marks)
+        return _Registry(index, handlers, observed)
+
+
+_EMPTY_REGISTRY = _Registry({}, {}, {})
+
+BUNDLE_SUFFIX = '.jinx'
+_BUNDLE_VERSION = 2
+# module file -> (its mtime, the classes of its valid bundle or None)
+_BUNDLES: Dict[str, Tuple[int, Optional[Dict[str, Any]]]] = {}
+# module file -> (its mtime, its content hash)
+_HASHES: Dict[str, Tuple[int, str]] = {}
+
+
+def _source_hash(source: bytes) -> str:
+    import hashlib
+    return hashlib.sha256(source).hexdigest()
+
+
+def _module_hash(module_name: Optional[str]) -> Optional[str]:
+    """Content hash of a loaded module's file; None if it has none."""
+    path = getattr(sys.modules.get(module_name), '__file__', None)
+    if not path:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        cached = _HASHES.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rb') as f:
+                cached = _HASHES[path] = (mtime, _source_hash(f.read()))
+    except OSError:
+        return None
+    return cached[1]
+
+
+def _parent_hashes(cls: type) -> Optional[Dict[str, str]]:
+    """Content hashes of the modules defining the bases of ``cls``, but for
+    its own, jinx and ops; None if one of them can't be hashed."""
+    hashes = {}
+    for base in cls.__mro__[1:]:
+        module = base.__module__
+        if (module in hashes or module in (cls.__module__, __name__,
+                                           'builtins')
+                or module.partition('.')[0] == 'ops'):
+            continue
+        digest = _module_hash(module)
+        if digest is None:
+            return None
+        hashes[module] = digest
+    return hashes
+
+
+def make_bundle(source: bytes, classes: Iterable[Type['Jinx']]) -> bytes:
+    """Precomputed registry data of ``classes``, all defined in ``source``.
+
+    Written next to the charm module (src/charm.py -> src/charm.jinx) by
+    unpack; JinxMeta then skips re-deriving it, as long as the content
+    hashes of the module, of jinx itself and of the modules defining each
+    class' bases still match.
+    """
+    bundle = {}
+    for cls in classes:
+        parents = _parent_hashes(cls)
+        if parents is None:
+            continue  # can't tell when it goes stale: leave it out
+        registry = cls.__jinx_registry__
+        # only this class' own observers; parents have their own entry
+        bundle[cls.__qualname__] = {
+            'parents': parents,
+            'observed': {
+                attr: registry.observed.get(attr, ())
+                for attr in vars(cls)
+                if attr in registry.observed or attr in registry.handlers}}
+    import marshal
+    return marshal.dumps({'version': _BUNDLE_VERSION,
+                          'jinx': _module_hash(__name__),
+                          'source': _source_hash(source),
+                          'classes': bundle})
+
+
+def _bundle_for(module_name: Optional[str]) -> Optional[Dict[str, Any]]:
+    """The classes in the bundle shipped with a module, if it's valid."""
+    path = getattr(sys.modules.get(module_name), '__file__', None)
+    if not path:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _BUNDLES.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    import marshal
+    classes = None
+    try:
+        with open(os.path.splitext(path)[0] + BUNDLE_SUFFIX, 'rb') as f:
+            bundle = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    else:
+        if (isinstance(bundle, dict)
+                and bundle.get('version') == _BUNDLE_VERSION
+                and bundle.get('jinx') == _module_hash(__name__)
+                and bundle.get('source') == _module_hash(module_name)):
+            classes = bundle['classes']
+    _BUNDLES[path] = (mtime, classes)
+    return classes
+
+
+def _precomputed(cls: type) -> Optional[Dict[str, Tuple[str, ...]]]:
+    """The observers of ``cls`` from its module's bundle, if still valid."""
+    bundle = _bundle_for(cls.__module__)
+    entry = bundle.get(cls.__qualname__) if bundle else None
+    if entry is None or entry['parents'] != _parent_hashes(cls):
+        return None
+    return entry['observed']
+
+
+def _check_observer(method: FunctionType):
+    """Validate a method's signature the way Framework.observe does."""
+    params = list(inspect.signature(method).parameters.values())[1:]
+    name = method.__qualname__
+    if not params:
+        raise TypeError(f'{name} must accept event parameter')
+    if any(p.default is inspect.Parameter.empty and
+           p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)
+           for p in params[1:]):
+        raise TypeError(f'{name} has extra required parameter')
+
+
+def _mark_observer(method: T, decl: Optional[LateBoundNamed], kind: str) -> T:
+    """Record on ``method`` that it observes ``kind`` (of ``decl``)."""
+    marks = method.__dict__.setdefault('__observes__', [])
+    # decorators apply bottom-up: keep the order they are written in
+    marks.insert(0, (decl, kind))
+    return method
+
+
+def observe(event_kind: str) -> Callable[[T], T]:
+    """Class-level decorator wiring a method to ``charm.on.<event_kind>``.
+
+    Example::
+
+        @observe('start')
+        def _on_start(self, event: StartEvent): ...
+    """
+    return lambda method: _mark_observer(method, None, event_kind)
 
 
 class JinxMeta(ops.framework._Metaclass, ABCMeta):
@@ -168,129 +763,797 @@ class JinxMeta(ops.framework._Metaclass, ABCMeta):
         return k
 
     def __new__(mcs: Type['Jinx'], name, bases, dct):
+        start = perf_counter()
         inst = super().__new__(mcs, name, bases, dct)
         # do what ops.framework._Metaclass does:
         JinxMeta._framework_meta_init(inst)
+        JinxMeta._register(inst, _Registry.build(bases, dct,
+                                                 _precomputed(inst)))
+        if os.environ.get(PROFILE_ENV):
+            _REGISTRY_TIMES[inst] = perf_counter() - start
         return inst
 
+    @staticmethod
+    def _register(cls, registry: _Registry):
+        cls.__jinx_registry__ = registry
+
+        # flat views kept for Serializer and charm code
+        relations = registry.relations
+        cls.__actions__ = list(registry.actions)
+        cls.__config__ = dict(registry.configs)
+        cls.__provides__ = [r for r in relations if r.role == 'provide']
+        cls.__requires__ = [r for r in relations if r.role == 'require']
+        cls.__peers__ = [r for r in relations if r.role == 'peer']
+        cls.__storage__ = list(registry.storages)
+        cls.__containers__ = list(registry.containers)
+        cls.__resources__ = list(registry.resources)
+        logger.debug('registered %s declarations and %s action handlers on %s',
+                     len(registry.index), len(registry.handlers), cls.__name__)
+
+
+class _LazyEvent:
+    """Event source on a bound view, looked up on the charm on first read.
+
+    The resolved ``BoundEvent`` is kept in the slot named after the
+    attribute with a leading underscore.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.slot = None
+
+    def __set_name__(self, owner, attr):
+        self.slot = '_' + attr
+
+    def __get__(self, bound: '_Bound', _type=None):
+        if bound is None:
+            return self
+        try:
+            return getattr(bound, self.slot)
+        except AttributeError:
+            pass
+        profile = bound._obj._profile
+        start = perf_counter() if profile else 0
+        kind = f'{_sanitize(bound.name)}_{self.kind}'
+        event = getattr(bound._obj.on, kind)
+        setattr(bound, self.slot, event)
+        if profile:
+            profile.add('event', kind, perf_counter() - start)
+        return event
+
+
+class _Bound:
+    """View of a declaration bound to a charm instance."""
+    __slots__ = ('_spec', '_obj')
+
+    def __init__(self, spec: LateBoundNamed, obj: CharmBase):
+        self._spec = spec
+        self._obj = obj
+
+    @property
+    def name(self) -> str:
+        return self._spec.name
+
+    @property
+    def meta(self):
+        return self._spec.meta
+
+    def _observe(self, event: str, callback: Callable[[EventBase], None]):
+        """Observe the event at attribute ``event``, if the charm wants it."""
+        obj = self._obj
+        kind = f'{_sanitize(self.name)}_{getattr(type(self), event).kind}'
+        if obj._dispatch_kinds is None or kind in obj._dispatch_kinds:
+            obj.framework.observe(getattr(self, event), callback)
+            if obj._profile:
+                obj._profile.time_handler(callback)
+
 
 class _Storage(LateBoundNamed):
+    __slots__ = ('meta',)
+
     def __init__(self, name: Optional[ContainerName], type: str,
                  location: str = None):
         super().__init__(name)
-        self.meta = FSStorageSpec(type, location)
+        self.meta = _intern(FSStorageSpec(type, location))
 
     def __get__(self, obj, _type=None):
-        return _BoundStorage(self.name, self.meta.type, self.meta.location, obj)
+        if obj is None:
+            return self
+        return self._cache(obj, _BoundStorage)
 
+    # class-level decorators; see observe()
+    def on_attached(self, method: T) -> T:
+        return _mark_observer(method, self, 'storage_attached')
 
-class _BoundStorage(_Storage):
-    def __init__(self, name: ContainerName, type: str, location: str,
-                 obj: CharmBase):
-        super().__init__(name, type, location)
-        self.attached = obj.on[_sanitize(name)].storage_attached
-        self.detaching = obj.on[_sanitize(name)].storage_detaching
-        self._obj = obj
+    def on_detached(self, method: T) -> T:
+        return _mark_observer(method, self, 'storage_detaching')
+
+
+class _BoundStorage(_Bound):
+    __slots__ = ('_attached', '_detaching')
+
+    attached = _LazyEvent('storage_attached')
+    detaching = _LazyEvent('storage_detaching')
 
     def on_attached(self, callback: Callable[[StorageAttachedEvent], None]):
-        self._obj.framework.observe(self.attached, callback)
+        self._observe('attached', callback)
 
     def on_detached(self, callback: Callable[[StorageDetachingEvent], None]):
-        self._obj.framework.observe(self.detaching, callback)
+        self._observe('detaching', callback)
 
 
 class _Action(LateBoundNamed):
+    __slots__ = ('params', 'meta', 'timeout')
+
     def __init__(self, name: Optional[ActionName],
-                 params: Dict[str, _Param] = None):
+                 params: Dict[str, _Param] = None,
+                 timeout: Optional[float] = None):
         super().__init__(name)
         self.params = params
-        self.meta = ActionMeta(params if params else {})
+        self.meta = _intern(ActionMeta(params if params else {}))
+        # seconds an async handler may run for before the action fails
+        self.timeout = timeout
 
     def as_dict(self):
-        return {self.name: asdict(self.meta)}
+        return {self.name: self.meta.to_dict()}
 
     def handler(self, method: Callable[['Jinx', ActionEvent], None]):
+        """Decorate the method handling this action.
+
+        ``method`` may be an ``async def``: it then runs on an event loop of
+        its own, for at most ``timeout`` seconds; see also fan_out.
+        """
         method.__action__ = self
+        if inspect.iscoroutinefunction(method):
+            call = functools.partial(_run_async, method, self.timeout)
+        else:
+            call = method
 
         @functools.wraps(method)
         def action_wrapper(_obj, _event: ActionEvent):
+            profile = getattr(_obj, '_profile', None)
+            if profile:
+                start = perf_counter()
+                ret_val = call(_obj, _event)
+                profile.add('action', method.__qualname__,
+                            perf_counter() - start)
+            else:
+                ret_val = call(_obj, _event)
             # Allow returning data from the action handler as a pattern.
-            ret_val = method(_obj, _event)
             if isinstance(ret_val, dict):
                 _event.set_results(ret_val)
 
         return action_wrapper
 
 
+def _run_async(method, timeout: Optional[float], obj: 'Jinx',
+               event: ActionEvent):
+    """Run an async action handler to completion on a private loop."""
+    import asyncio
+    try:
+        return asyncio.run(asyncio.wait_for(method(obj, event), timeout))
+    except asyncio.TimeoutError:
+        event.fail(f'timed out after {timeout}s')
+
+
+async def fan_out(event: ActionEvent,
+                  calls: Mapping[str, Union[Callable[[], T], Awaitable[T]]],
+                  limit: Optional[int] = None) -> Dict[str, T]:
+    """Run ``calls`` concurrently, logging progress on the action ``event``.
+
+    Each value is an awaitable, or a blocking callable (e.g. a pebble or
+    HTTP call) to run in a daemon thread of its own. At most ``limit`` run
+    at once. On an action timeout the handler returns without waiting for
+    the blocking calls, which are not interrupted: they keep running, and
+    their side effects can land, while ops finishes the dispatch (other
+    handlers, the commit), until the hook process exits. In a Harness or
+    any other long-lived process they run to completion, across later
+    events. So they must be safe to abandon and must not touch the charm,
+    its model or stored state.
+    Returns the results by key; if any call raised, the first exception is
+    re-raised once all calls are done.
+
+    Example::
+
+        @backup.handler
+        async def _on_backup(self, event):
+            return await fan_out(event, {
+                name: functools.partial(self.dump, name) for name in DBS})
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(limit or len(calls) or 1)
+    results = {}
+    errors = []
+
+    async def run(key, call):
+        async with semaphore:
+            try:
+                if callable(call):
+                    results[key] = await _in_thread(loop, call)
+                else:
+                    results[key] = await call
+                outcome = 'done'
+            except Exception as e:
+                errors.append(e)
+                outcome = f'failed: {e}'
+        event.log(f'[{len(results) + len(errors)}/{len(calls)}] '
+                  f'{key} {outcome}')
+
+    await asyncio.gather(*(run(key, call) for key, call in calls.items()))
+    if errors:
+        raise errors[0]
+    return {key: results[key] for key in calls}
+
+
+def _in_thread(loop, call: Callable[[], T]) -> 'Awaitable[T]':
+    """Run ``call`` in a daemon thread; unlike run_in_executor, neither the
+    loop nor interpreter exit wait for it. If nobody awaits the result any
+    more, the thread still runs ``call`` to the end, or until the process
+    exits; see fan_out."""
+    import threading
+    future = loop.create_future()
+
+    def settle(result, error):
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run():
+        result = error = None
+        try:
+            result = call()
+        except BaseException as e:
+            error = e
+        try:
+            loop.call_soon_threadsafe(settle, result, error)
+        except RuntimeError:  # the loop is closed: nobody is waiting
+            pass
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
 class _Resource(LateBoundNamed):
+    __slots__ = ('meta',)
+
     def __init__(self, name: Optional[ContainerName] = None,
                  type: str = 'oci-image',
                  description: str = None,
                  upstream_source: str = None):
         super().__init__(name)
-        self.meta = ResourceSpec(type, description, upstream_source)
+        self.meta = _intern(ResourceSpec(type, description, upstream_source))
 
 
 class _Container(LateBoundNamed):
+    __slots__ = ('meta',)
+
     def __init__(self, name: Optional[ContainerName], resource: str):
         super().__init__(name)
-        self.meta = ContainerSpec(resource)
+        self.meta = _intern(ContainerSpec(resource))
 
     def __get__(self, obj, _type=None):
-        return _BoundContainer(self.name, self.meta.resource, obj)
+        if obj is None:
+            return self
+        return self._cache(obj, _BoundContainer)
 
+    # class-level decorators; see observe()
+    def on_pebble_ready(self, method: T) -> T:
+        return _mark_observer(method, self, 'pebble_ready')
 
-class _BoundContainer(_Container):
-    def __init__(self, name: ContainerName, resource: str,
-                 obj: CharmBase):
-        super().__init__(name, resource)
-        self.pebble_ready = obj.on[_sanitize(name)].pebble_ready
-        self._obj = obj
+
+class _BoundContainer(_Bound):
+    """A container of the charm, looked up once per hook.
+
+    Also keeps the pebble plan between ``add_layer``/``replan`` calls made
+    through it, and batches pushes and execs.
+    """
+    __slots__ = ('_pebble_ready', '_container', '_plan')
+
+    pebble_ready = _LazyEvent('pebble_ready')
 
     def on_pebble_ready(self, callback: Callable[[PebbleReadyEvent], None]):
-        self._obj.framework.observe(self.pebble_ready, callback)
+        self._observe('pebble_ready', callback)
+
+    @property
+    def container(self) -> Container:
+        try:
+            return self._container
+        except AttributeError:
+            container = self._container = self._obj.unit.get_container(
+                self.name)
+            return container
+
+    @property
+    def pebble(self) -> 'ops.pebble.Client':
+        return self.container.pebble
+
+    @property
+    def plan(self) -> 'ops.pebble.Plan':
+        """The pebble plan, fetched on first use."""
+        try:
+            return self._plan
+        except AttributeError:
+            plan = self._plan = self.container.get_plan()
+            return plan
+
+    def add_layer(self, label: str, layer: Union[str, Dict[str, Any]],
+                  *, combine: bool = False):
+        self.container.add_layer(label, layer, combine=combine)
+        self.invalidate_plan()
+
+    def replan(self):
+        self.container.replan()
+        self.invalidate_plan()
+
+    def invalidate_plan(self):
+        """Forget the plan, e.g. after changing it some other way."""
+        try:
+            del self._plan
+        except AttributeError:
+            pass
+
+    def push_many(self, files: Mapping[str, Union[str, bytes]], *,
+                  encoding: str = 'utf-8', make_dirs: bool = False,
+                  permissions: Optional[int] = None,
+                  user_id: Optional[int] = None, user: Optional[str] = None,
+                  group_id: Optional[int] = None, group: Optional[str] = None):
+        """Write many files (path -> content) in one pebble request."""
+        client = self.pebble
+        if not _can_push_files(client):
+            # e.g. the Harness' fake client: push them one by one
+            for path, source in files.items():
+                client.push(path, source, encoding=encoding,
+                            make_dirs=make_dirs, permissions=permissions,
+                            user_id=user_id, user=user, group_id=group_id,
+                            group=group)
+            return
+        info = client._make_auth_dict(permissions, user_id, user, group_id,
+                                      group)
+        if make_dirs:
+            info['make-dirs'] = True
+        _push_files(client, files, info, encoding)
+
+    def exec_many(self, commands: Sequence[List[str]],
+                  **kwargs) -> List[Tuple[str, Optional[str]]]:
+        """Run ``commands`` concurrently; their (stdout, stderr), in order.
+
+        All processes are started before any is waited on. ``kwargs`` go to
+        ``Container.exec``. If any command fails, the first error is raised
+        once all have finished. If one can't be started, those already
+        started are killed and waited on before the error is raised.
+        """
+        processes = []
+        try:
+            for command in commands:
+                processes.append(self.container.exec(command, **kwargs))
+        except BaseException:
+            for process in processes:
+                try:
+                    process.send_signal('SIGKILL')
+                    process.wait()
+                except Exception:  # e.g. it had exited already
+                    pass
+            raise
+        outputs = []
+        errors = []
+        for process in processes:
+            try:
+                outputs.append(process.wait_output())
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        return outputs
+
+
+# private parts of ops.pebble.Client that _push_files relies on, as found
+# in the ops 1.x releases jinx is tested with
+_PUSH_FILES_API = ('_make_auth_dict', '_request_raw', '_ensure_content_type',
+                   '_raise_on_path_error')
+
+
+def _can_push_files(client: 'ops.pebble.Client') -> bool:
+    """Whether _push_files can drive ``client``; else use the public push."""
+    return (isinstance(client, ops.pebble.Client)
+            and getattr(ops, '__version__', '').startswith('1.')
+            and all(hasattr(client, name) for name in _PUSH_FILES_API))
+
+
+def _push_files(client: 'ops.pebble.Client',
+                files: Mapping[str, Union[str, bytes]],
+                info: Dict[str, Any], encoding: str):
+    """What Client.push does, for several files in one multipart request."""
+    import binascii
+    import json
+
+    boundary = binascii.hexlify(os.urandom(16))
+    metadata = {'action': 'write',
+                'files': [dict(info, path=path) for path in files]}
+    parts = [b'--', boundary, b'\r\n',
+             b'Content-Type: application/json\r\n',
+             b'Content-Disposition: form-data; name="request"\r\n',
+             b'\r\n', json.dumps(metadata).encode('utf-8'), b'\r\n']
+    for path, source in files.items():
+        if isinstance(source, str):
+            source = source.encode(encoding)
+        parts += [b'--', boundary, b'\r\n',
+                  b'Content-Type: application/octet-stream\r\n',
+                  b'Content-Disposition: form-data; name="files"; filename="',
+                  path.replace('"', '\\"').encode('utf-8'), b'"\r\n',
+                  b'\r\n', source, b'\r\n']
+    parts += [b'--', boundary, b'--\r\n']
+
+    headers = {
+        'Accept': 'application/json',
+        'Content-Type': 'multipart/form-data; boundary="'
+                        + boundary.decode('utf-8') + '"',
+    }
+    response = client._request_raw('POST', '/v1/files', None, headers,
+                                   b''.join(parts))
+    client._ensure_content_type(response.headers, 'application/json')
+    resp = json.loads(response.read())
+    for path in files:
+        client._raise_on_path_error(resp, path)
 
 
 Role = Literal['require', 'provide', 'peer']
 
 
 class _Relation(LateBoundNamed):
-    def __init__(self, name: Optional[str], interface: str, role: Role):
+    __slots__ = ('meta', 'role')
+
+    def __init__(self, name: Optional[str], interface: str, role: Role,
+                 app: Optional[Dict[str, _Param]] = None,
+                 unit: Optional[Dict[str, _Param]] = None):
         super().__init__(name)
-        self.meta = InterfaceMeta(interface)
+        schema = DatabagSchema(app, unit) if app or unit else None
+        self.meta = _intern(InterfaceMeta(interface, schema))
         self.role = role
 
     def __get__(self, obj, _type=None):
-        return _BoundRelation(self.name, self.meta.interface, self.role, obj)
-
-
-class _BoundRelation(_Relation):
-    def __init__(self, name: str,
-                 interface: str,
-                 role: Role,
-                 obj: CharmBase):
-        super().__init__(name, interface, role)
-        self.created = obj.on[_sanitize(name)].relation_created
-        self.broken = obj.on[_sanitize(name)].relation_broken
-        self.joined = obj.on[_sanitize(name)].relation_joined
-        self.departed = obj.on[_sanitize(name)].relation_departed
-        self.changed = obj.on[_sanitize(name)].relation_changed
-        self._obj = obj
+        if obj is None:
+            return self
+        return self._cache(obj, _BoundRelation)
+
+    # class-level decorators; see observe()
+    def on_created(self, method: T) -> T:
+        return _mark_observer(method, self, 'relation_created')
+
+    def on_broken(self, method: T) -> T:
+        return _mark_observer(method, self, 'relation_broken')
+
+    def on_joined(self, method: T) -> T:
+        return _mark_observer(method, self, 'relation_joined')
+
+    def on_departed(self, method: T) -> T:
+        return _mark_observer(method, self, 'relation_departed')
+
+    def on_changed(self, method: T) -> T:
+        return _mark_observer(method, self, 'relation_changed')
+
+
+class _BoundRelation(_Bound):
+    __slots__ = ('_created', '_broken', '_joined', '_departed', '_changed',
+                 '_databags')
+
+    created = _LazyEvent('relation_created')
+    broken = _LazyEvent('relation_broken')
+    joined = _LazyEvent('relation_joined')
+    departed = _LazyEvent('relation_departed')
+    changed = _LazyEvent('relation_changed')
+
+    @property
+    def role(self) -> 'Role':
+        return self._spec.role
 
     def on_created(self, callback: Callable[[RelationCreatedEvent], None]):
-        self._obj.framework.observe(self.created, callback)
+        self._observe('created', callback)
 
     def on_broken(self, callback: Callable[[RelationBrokenEvent], None]):
-        self._obj.framework.observe(self.broken, callback)
+        self._observe('broken', callback)
 
     def on_joined(self, callback: Callable[[RelationJoinedEvent], None]):
-        self._obj.framework.observe(self.joined, callback)
+        self._observe('joined', callback)
 
     def on_departed(self, callback: Callable[[RelationDepartedEvent], None]):
-        self._obj.framework.observe(self.departed, callback)
+        self._observe('departed', callback)
 
     def on_changed(self, callback: Callable[[RelationChangedEvent], None]):
-        self._obj.framework.observe(self.changed, callback)
+        self._observe('changed', callback)
+
+    @property
+    def relation(self) -> Optional[Relation]:
+        """The one relation on this endpoint, if any; see Model.get_relation."""
+        return self._obj.model.get_relation(self.name)
+
+    @property
+    def relations(self) -> List[Relation]:
+        return self._obj.model.relations[self.name]
+
+    def databag(self, entity: Union[Unit, Application],
+                relation: Optional[Relation] = None) -> '_Databag':
+        """The databag of ``entity`` in ``relation`` (default: the one).
+
+        Read with a single relation-get; writes are staged and flushed with
+        one relation-set when the framework commits.
+        """
+        if relation is None:
+            relation = self.relation
+            if relation is None:
+                raise RelationNotFoundError(self.name)
+        key = (relation.id, entity.name, isinstance(entity, Application))
+        try:
+            databags = self._databags
+        except AttributeError:
+            databags = self._databags = {}
+        try:
+            return databags[key]
+        except KeyError:
+            databag = databags[key] = _Databag(self._obj,
+                                               relation.data[entity])
+            return databag
+
+    def remote_databags(self, relation: Optional[Relation] = None
+                        ) -> Dict[Union[Unit, Application], '_Databag']:
+        """The databags of the remote units and app, by entity.
+
+        They are loaded lazily, each with a single relation-get.
+        """
+        if relation is None:
+            relation = self.relation
+            if relation is None:
+                raise RelationNotFoundError(self.name)
+        entities = list(relation.units)
+        if relation.app is not None:
+            entities.append(relation.app)
+        return {entity: self.databag(entity, relation) for entity in entities}
+
+    def _codec(self, entity: Union[Unit, Application]) -> _Codec:
+        schema = self._spec.meta.schema
+        bag = 'app' if isinstance(entity, Application) else 'unit'
+        fields_ = getattr(schema, bag) if schema is not None else None
+        if fields_ is None:
+            raise RuntimeError(f'{self.name} declares no {bag} databag schema')
+        return _Codec.of(fields_)
+
+    def read(self, entity: Union[Unit, Application],
+             relation: Optional[Relation] = None) -> _Record:
+        """The databag of ``entity`` decoded with the declared schema.
+
+        Decoded once, until the databag is written to or ops reloads its
+        content (as at the next event in a Harness); raises
+        RelationDataError on a bad value.
+        """
+        databag = self.databag(entity, relation)
+        data = databag._content._data
+        cached = databag._record
+        if cached is not None and cached[0] is data:
+            return cached[1]
+        record = self._codec(entity).decode(databag)
+        databag._record = (data, record)
+        return record
+
+    def write(self, entity: Union[Unit, Application],
+              relation: Optional[Relation] = None, **values: Any):
+        """Stage ``values`` (by field attribute) in the databag of ``entity``.
+
+        They are encoded with the declared schema; None removes a field.
+        """
+        codec = self._codec(entity)
+        unknown = set(values).difference(codec.record_type.__slots__)
+        if unknown:
+            raise TypeError(f'unknown {self.name} databag fields: '
+                            f'{", ".join(sorted(unknown))}')
+        databag = self.databag(entity, relation)
+        databag.update(codec.encode(values))
+
+
+class _Databag(MutableMapping):
+    """A relation databag, read at once, with writes staged until commit.
+
+    Setting a key to '' or deleting it removes it, as with relation-set.
+    """
+    __slots__ = ('_charm', '_content', '_staged', '_record')
+
+    def __init__(self, charm: 'Jinx', content: RelationDataContent):
+        self._charm = charm
+        self._content = content
+        # key -> staged value; '' stages a removal
+        self._staged: Dict[str, str] = {}
+        # (content data it was decoded from, record); see _BoundRelation.read
+        self._record: Optional[Tuple[Dict[str, str], _Record]] = None
+
+    def _merged(self) -> Dict[str, str]:
+        data = dict(self._content)
+        for key, value in self._staged.items():
+            if value:
+                data[key] = value
+            else:
+                data.pop(key, None)
+        return data
+
+    def __getitem__(self, key: str) -> str:
+        value = self._staged.get(key)
+        if value is None:
+            return self._content[key]
+        if not value:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: str):
+        # checked now rather than at commit, so errors point at the write
+        content = self._content
+        if not content._is_mutable():
+            raise RelationDataError(
+                f'cannot set relation data for {content._entity.name}')
+        if not isinstance(value, str):
+            raise RelationDataError('relation data values must be strings')
+        if not self._staged:
+            self._charm._stage_databag(self)
+        self._staged[key] = value
+        self._record = None
+
+    def __delitem__(self, key: str):
+        if key not in self:
+            raise KeyError(key)
+        self[key] = ''
+
+    def __iter__(self):
+        return iter(self._merged())
+
+    def __len__(self):
+        return len(self._merged())
+
+    def __repr__(self):
+        return repr(self._merged())
+
+    def changes(self) -> Dict[str, str]:
+        """The staged writes that differ from the databag's content."""
+        content = self._content
+        return {key: value for key, value in self._staged.items()
+                if content.get(key, '') != value}
+
+    def flush(self):
+        """Write the staged changes, if any, in one relation-set."""
+        changes = self.changes()
+        self._staged.clear()
+        if changes:
+            _relation_set(self._content, changes)
+
+
+def _relation_set(content: RelationDataContent, changes: Dict[str, str]):
+    """What setting each key of ``content`` does, in one hook tool call."""
+    backend = content._backend
+    if len(changes) == 1 or not isinstance(backend, ops.model._ModelBackend):
+        # e.g. the Harness' backend, which only sets one key at a time
+        for key, value in changes.items():
+            content[key] = value
+        return
+
+    if not content._is_mutable():
+        raise RelationDataError(
+            f'cannot set relation data for {content._entity.name}')
+    args = ['relation-set', '-r', str(content.relation.id)]
+    args += [f'{key}={value}' for key, value in changes.items()]
+    if content._is_app:
+        version = JujuVersion.from_environ()
+        if not version.has_app_data():
+            raise RuntimeError(f'setting application data is not supported '
+                               f'on Juju version {version}')
+        args.append('--app')
+    try:
+        backend._run(*args)
+    except ModelError as e:
+        if backend._is_relation_not_found(e):
+            raise RelationNotFoundError() from e
+        raise
+
+    if content._lazy_data is not None:
+        for key, value in changes.items():
+            if value:
+                content._data[key] = value
+            else:
+                content._data.pop(key, None)
+
+
+class _ConfigChangedBoundEvent(BoundEvent):
+    def emit(self, *args, **kwargs):
+        charm = self.emitter._charm and self.emitter._charm()
+        if charm is not None:
+            charm._config_snapshot = None
+        super().emit(*args, **kwargs)
+
+
+class _ConfigChangedSource(EventSource):
+    """config_changed, dropping the emitting charm's config snapshot."""
+
+    def __get__(self, emitter, emitter_type=None):
+        if emitter is None:
+            return self
+        framework = getattr(emitter, 'framework', None)
+        if framework is not None:
+            framework.register_type(self.event_type, emitter, self.event_kind)
+        return _ConfigChangedBoundEvent(emitter, self.event_type,
+                                        self.event_kind)
+
+
+class JinxEvents(CharmEvents):
+    config_changed = _ConfigChangedSource(ConfigChangedEvent)
+
+    def __init__(self, parent=None, key=None):
+        super().__init__(parent, key)
+        self._charm = weakref.ref(parent) if parent is not None else None
+
+
+PROFILE_ENV = 'JINX_PROFILE'
+PROFILE_FILE = '.jinx-profile.jsonl'
+
+# Jinx class -> seconds its creation took, recorded if profiling
+_REGISTRY_TIMES: 'weakref.WeakKeyDictionary[type, float]' = \
+    weakref.WeakKeyDictionary()
+
+
+class _Profile:
+    """Timings of the jinx phases of a dispatch.
+
+    Set JINX_PROFILE=file to append one JSON line per dispatch to
+    .jinx-profile.jsonl in the charm dir; any other value logs that line
+    on the 'jinx' logger (so it ends up in juju debug-log).
+    """
+    __slots__ = ('mode', 'timings')
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        # (phase, name, seconds)
+        self.timings: List[Tuple[str, str, float]] = []
+
+    def add(self, phase: str, name: str, seconds: float):
+        self.timings.append((phase, name, seconds))
+
+    def time_handler(self, callback: Callable[[EventBase], None],
+                     name: Optional[str] = None):
+        """Time the calls the framework makes to the method ``callback``.
+
+        Framework looks observers up by name on their object, so a timed
+        method is put in the object's dict, shadowing the original.
+        """
+        if getattr(callback, '__jinx_profiled__', False):
+            return
+        owner, name = callback.__self__, name or callback.__name__
+        label = f'{type(owner).__name__}.{name}'
+        profile = self
+
+        def timed(_self, event):
+            start = perf_counter()
+            try:
+                return callback(event)
+            finally:
+                profile.add('handler', label, perf_counter() - start)
+
+        timed.__name__ = name
+        timed.__jinx_profiled__ = True
+        vars(owner)[name] = MethodType(timed, owner)
+
+    def report(self, charm: CharmBase) -> Dict[str, Any]:
+        return {'charm': type(charm).__name__,
+                'dispatch': os.environ.get('JUJU_DISPATCH_PATH'),
+                'timings': [{'phase': phase, 'name': name,
+                             'ms': round(seconds * 1000, 3)}
+                            for phase, name, seconds in self.timings]}
+
+    def emit(self, charm: CharmBase):
+        import json
+        line = json.dumps(self.report(charm))
+        self.timings.clear()
+        if self.mode == 'file':
+            with open(charm.charm_dir / PROFILE_FILE, 'a') as f:
+                f.write(line + '\n')
+        else:
+            logger.info('profile %s', line)
 
 
 class ExtendedConfigData(ConfigData):
@@ -299,6 +1562,7 @@ class ExtendedConfigData(ConfigData):
 
 
 class Jinx(CharmBase, metaclass=JinxMeta):
+    __jinx_registry__: _Registry
     __actions__: List['_Action']
     __config__: Dict[str, '_Config']
     __provides__: List['_Relation']
@@ -308,6 +1572,13 @@ class Jinx(CharmBase, metaclass=JinxMeta):
     __containers__: List['_Container']
     __resources__: List['_Resource']
 
+    on = JinxEvents()
+    _config_snapshot: Optional[_ConfigSnapshot] = None
+    # set in __init__ if JINX_PROFILE is
+    _profile: Optional[_Profile] = None
+    # databags with staged writes, flushed on pre_commit
+    _staged_databags: Optional[List[_Databag]] = None
+
     if TYPE_CHECKING:
         framework: Framework
 
@@ -319,130 +1590,189 @@ class Jinx(CharmBase, metaclass=JinxMeta):
     summary: Optional[str] = None
     maintainer: Optional[str] = None
     description: Optional[str] = None
-    bases: List[Base] = [Base(build_on=[Platform('ubuntu', '20.04')],
-                              run_on=[Platform('ubuntu', '20.04')])]
+    bases: List[Base] = [_intern(Base(build_on=[Platform('ubuntu', '20.04')],
+                                      run_on=[Platform('ubuntu', '20.04')]))]
     subordinate: bool = False
 
+    # Set to True to only wire the observers this dispatch can fire; see
+    # _scope_to_dispatch.
+    dispatch_scoped: bool = False
+    # event kinds this instance wires observers for; None means all of them
+    _dispatch_kinds: Optional[FrozenSet[str]] = None
+
+    def __init__(self, framework: Framework, key: Optional[str] = None):
+        start = perf_counter()
+        mode = os.environ.get(PROFILE_ENV)
+        if mode:
+            self._profile = _Profile(mode)
+        super().__init__(framework, key)
+        if self.dispatch_scoped:
+            self._dispatch_kinds = self._scope_to_dispatch()
+        observers = type(self).__jinx_registry__.observers
+        if self._dispatch_kinds is not None:
+            observers = tuple(o for o in observers
+                              if o[1] in self._dispatch_kinds)
+        if observers:
+            self._observe_all(observers)
+        if mode:
+            self._start_profile(perf_counter() - start)
+
+    def _start_profile(self, init_time: float):
+        profile = self._profile
+        cls = type(self)
+        if cls in _REGISTRY_TIMES:
+            profile.add('registry', cls.__name__, _REGISTRY_TIMES.pop(cls))
+        profile.add('init', cls.__name__, init_time)
+        self.framework.observe(self.framework.on.commit, self._emit_profile)
+
+    def _emit_profile(self, _event):
+        self._profile.emit(self)
+
+    def _stage_databag(self, databag: _Databag):
+        if self._staged_databags is None:
+            self._staged_databags = []
+            self.framework.observe(self.framework.on.pre_commit,
+                                   self._on_pre_commit)
+        self._staged_databags.append(databag)
+
+    def _on_pre_commit(self, _event):
+        self.flush_databags()
+
+    def flush_databags(self):
+        """Write the staged relation data now instead of at commit."""
+        staged = self._staged_databags
+        if staged:
+            self._staged_databags = []
+            for databag in staged:
+                databag.flush()
+
+    def _scope_to_dispatch(self) -> Optional[FrozenSet[str]]:
+        """Event kinds that can fire during this dispatch.
+
+        That is the event Juju is dispatching (JUJU_DISPATCH_PATH, named the
+        way ops.main names it) plus those of the events deferred on this
+        charm, which ops re-emits first. Outside of a Juju dispatch (e.g. in
+        a Harness) this is None and every observer is wired.
+
+        Only used if the class sets ``dispatch_scoped = True``, which a
+        charm that emits its own charm events (``self.on.x.emit()``) from a
+        handler must not do: their observers wouldn't be wired.
+        """
+        dispatch_path = os.environ.get('JUJU_DISPATCH_PATH')
+        if not dispatch_path:
+            return None
+        parent, _, name = dispatch_path.rpartition('/')
+        kind = name.replace('-', '_')
+        if parent.rpartition('/')[2] == 'actions':
+            kind += '_action'
+
+        kinds = {kind}
+        prefix = self.on.handle.path + '/'
+        for event_path, _, _ in self.framework._storage.notices(None):
+            if event_path.startswith(prefix):
+                kinds.add(event_path[len(prefix):].partition('[')[0])
+        return frozenset(kinds)
+
+    def _observe(self, event_kind: str,
+                 callback: Callable[[EventBase], None]) -> None:
+        kinds = self._dispatch_kinds
+        if kinds is None or event_kind in kinds:
+            self.framework.observe(getattr(self.on, event_kind), callback)
+            if self._profile:
+                self._profile.time_handler(callback)
+
+    def _observe_all(self, observers: Tuple[Tuple[str, str], ...]):
+        """Wire the class' observer table in bulk.
+
+        Does what Framework.observe does for each (method, event kind) pair,
+        minus the signature check, which happened at class creation.
+        """
+        framework = self.framework
+        observer_path = self.handle.path
+        emitter = self.on
+        emitter_path = emitter.handle.path
+        framework._observer[observer_path] = self
+        for method_name, event_kind in observers:
+            # getting the event registers its type, as observe would
+            getattr(emitter, event_kind)
+            framework._observers.append(
+                (observer_path, method_name, emitter_path, event_kind))
+            if self._profile:
+                self._profile.time_handler(getattr(self, method_name),
+                                           method_name)
+
     def on_install(self, callback: Callable[[InstallEvent], None]) -> None:
         """Register a callback for install."""
-        self.framework.observe(self.on.install, callback)
+        self._observe('install', callback)
 
     def on_start(self, callback: Callable[[StartEvent], None]) -> None:
         """Register a callback for start."""
-        self.framework.observe(self.on.start, callback)
+        self._observe('start', callback)
 
     def on_stop(self, callback: Callable[[StopEvent], None]) -> None:
         """Register a callback for stop."""
-        self.framework.observe(self.on.stop, callback)
+        self._observe('stop', callback)
 
     def on_remove(self, callback: Callable[[RemoveEvent], None]) -> None:
         """Register a callback for remove."""
-        self.framework.observe(self.on.remove, callback)
+        self._observe('remove', callback)
 
     def on_update_status(self,
                          callback: Callable[[UpdateStatusEvent], None]) -> None:
         """Register a callback for update_status."""
-        self.framework.observe(self.on.update_status, callback)
+        self._observe('update_status', callback)
 
     def on_config_changed(self, callback: Callable[
         [ConfigChangedEvent], None]) -> None:
         """Register a callback for config_changed."""
-        self.framework.observe(self.on.config_changed, callback)
+        self._observe('config_changed', callback)
 
     def on_upgrade_charm(self,
                          callback: Callable[[UpgradeCharmEvent], None]) -> None:
         """Register a callback for upgrade_charm."""
-        self.framework.observe(self.on.upgrade_charm, callback)
+        self._observe('upgrade_charm', callback)
 
     def on_pre_series_upgrade(self, callback: Callable[
         [PreSeriesUpgradeEvent], None]) -> None:
         """Register a callback for pre_series_upgrade."""
-        self.framework.observe(self.on.pre_series_upgrade, callback)
+        self._observe('pre_series_upgrade', callback)
 
     def on_post_series_upgrade(self, callback: Callable[
         [PostSeriesUpgradeEvent], None]) -> None:
         """Register a callback for post_series_upgrade."""
-        self.framework.observe(self.on.post_series_upgrade, callback)
+        self._observe('post_series_upgrade', callback)
 
     def on_leader_elected(self, callback: Callable[
         [LeaderElectedEvent], None]) -> None:
         """Register a callback for leader_elected."""
-        self.framework.observe(self.on.leader_elected, callback)
+        self._observe('leader_elected', callback)
 
     def on_leader_settings_changed(self, callback: Callable[
         [LeaderSettingsChangedEvent], None]) -> None:
         """Register a callback for leader_settings_changed."""
-        self.framework.observe(self.on.leader_settings_changed, callback)
+        self._observe('leader_settings_changed', callback)
 
     def on_collect_metrics(self, callback: Callable[
         [CollectMetricsEvent], None]) -> None:
         """Register a callback for collect_metrics."""
-        self.framework.observe(self.on.collect_metrics, callback)
+        self._observe('collect_metrics', callback)
 
     @property
     def config(self) -> ExtendedConfigData:
         config_ = super().config
-        changed = self.on.config_changed
-
-        def on_changed(_, callback: Callable[[ConfigChangedEvent], None]):
-            self.framework.observe(changed, callback)
-
-        # we patch in a couple of attributes
-        config_.on_changed = on_changed
-        config_.changed = changed
+        if 'changed' not in vars(config_):
+            # we patch in a couple of attributes, once per model
+            config_.on_changed = self.on_config_changed
+            config_.changed = self.on.config_changed
         return config_
 
-    def __init_subclass__(cls, **kwargs):
-        # dedup
-        cls.__actions__: List['_Action'] = []
-        cls.__config__: Dict[str, '_Config'] = {}
-        cls.__provides__: List['_Relation'] = []
-        cls.__requires__: List['_Relation'] = []
-        cls.__peers__: List['_Relation'] = []
-        cls.__storage__: List['_Storage'] = []
-        cls.__containers__: List['_Container'] = []
-        cls.__resources__: List['_Resource'] = []
-
-        for parent in cls.mro():
-            for name, obj in vars(parent).items():
-                if isinstance(obj, LateBoundNamed):
-                    # allow defaulting name to the attr they are assigned
-                    # to in this class
-                    obj.bind(name)
-
-                if isinstance(obj, _Action):
-                    handlers = [obj for obj in vars(cls) if
-                                getattr(obj, '__action__', None) is obj]
-                    for handler in handlers:
-                        logger.debug(
-                            f'registered action handler for {name}: {handler}')
-                        cls.framework.observe(cls.on[obj.name].action, handler)
-
-                    cls.__actions__.append(obj)
-
-                elif isinstance(obj, _Storage):
-                    cls.__storage__.append(obj)
-
-                elif isinstance(obj, _Container):
-                    cls.__containers__.append(obj)
-
-                elif isinstance(obj, _Resource):
-                    cls.__resources__.append(obj)
-
-                elif isinstance(obj, _Config):
-                    cls.__config__[name] = obj
-                    logger.debug(f'registered config handle for {name}: {obj}')
-
-                elif isinstance(obj, _Relation):
-                    if obj.role == 'provide':
-                        cls.__provides__.append(obj)
-                        logger.debug(f'registered provides({name})')
-                    if obj.role == 'require':
-                        cls.__requires__.append(obj)
-                        logger.debug(f'registered requires({name})')
-                    if obj.role == 'peer':
-                        cls.__peers__.append(obj)
-                        logger.debug(f'registered peer({name})')
+    def _load_config_snapshot(self) -> _ConfigSnapshot:
+        start = perf_counter()
+        snapshot = self._config_snapshot = _ConfigSnapshot.load(
+            type(self).__jinx_registry__.configs, self.model.config)
+        if self._profile:
+            self._profile.add('config', 'snapshot', perf_counter() - start)
+        return snapshot
 
 
 # utility constructors
@@ -450,20 +1780,32 @@ def config(param: _Param, name: str = None) -> _Config:
     return _Config(name, param)
 
 
-def relation(interface: str, role: Role, name: str = None) -> _Relation:
-    return _Relation(name, interface=interface, role=role)
+def relation(interface: str, role: Role, name: str = None,
+             app: Dict[str, _Param] = None,
+             unit: Dict[str, _Param] = None) -> _Relation:
+    return _Relation(name, interface=interface, role=role, app=app,
+                     unit=unit)
 
 
-def require(interface: str = None, name: str = None) -> _Relation:
-    return _Relation(name, interface=interface, role='require')
+def require(interface: str = None, name: str = None,
+            app: Dict[str, _Param] = None,
+            unit: Dict[str, _Param] = None) -> _Relation:
+    return _Relation(name, interface=interface, role='require', app=app,
+                     unit=unit)
 
 
-def provide(interface: str = None, name: str = None) -> _Relation:
-    return _Relation(name, interface=interface, role='provide')
+def provide(interface: str = None, name: str = None,
+            app: Dict[str, _Param] = None,
+            unit: Dict[str, _Param] = None) -> _Relation:
+    return _Relation(name, interface=interface, role='provide', app=app,
+                     unit=unit)
 
 
-def peer(interface: str = None, name: str = None) -> _Relation:
-    return _Relation(name, interface=interface, role='peer')
+def peer(interface: str = None, name: str = None,
+         app: Dict[str, _Param] = None,
+         unit: Dict[str, _Param] = None) -> _Relation:
+    return _Relation(name, interface=interface, role='peer', app=app,
+                     unit=unit)
 
 
 def container(resource: str, name: str = None) -> _Container:
@@ -478,8 +1820,9 @@ def resource(type: str = 'oci-image',
                      upstream_source=upstream_source)
 
 
-def action(params: Dict[str, _Param] = None, name: str = None) -> _Action:
-    return _Action(name, params)
+def action(params: Dict[str, _Param] = None, name: str = None,
+           timeout: Optional[float] = None) -> _Action:
+    return _Action(name, params, timeout)
 
 
 def storage(type: str, location: str = None, name: str = None) -> _Storage:
@@ -489,26 +1832,67 @@ def storage(type: str, location: str = None, name: str = None) -> _Storage:
 # fmt: on
 
 
+# Jinx class -> (registry the entry was computed from, section -> data)
+_SERIALIZED: 'weakref.WeakKeyDictionary[Type[Jinx], Tuple[_Registry, Dict[str, Any]]]' = \
+    weakref.WeakKeyDictionary()
+
+
+def _memoized(method: Callable[['Serializer'], Any]) -> property:
+    """Compute a Serializer section once per Jinx class.
+
+    The cached data is shared: callers must not mutate it.
+    """
+    section = method.__name__
+
+    @functools.wraps(method)
+    def getter(self: 'Serializer'):
+        memo = self._memo()
+        try:
+            return memo[section]
+        except KeyError:
+            data = memo[section] = method(self)
+            return data
+
+    return property(getter)
+
+
 class Serializer:
     def __init__(self, jinx: Type[Jinx]):
         self.jinx = jinx
 
-    @property
+    def _memo(self) -> Dict[str, Any]:
+        jinx = self.jinx
+        registry = jinx.__jinx_registry__
+        cached = _SERIALIZED.get(jinx)
+        if cached is None or cached[0] is not registry:
+            cached = _SERIALIZED[jinx] = (registry, {})
+        return cached[1]
+
+    @staticmethod
+    def invalidate(jinx: Type[Jinx]):
+        """Drop the serialized forms of ``jinx``.
+
+        Needed after changing class attributes such as ``summary`` or
+        ``bases`` on an existing class; a new registry is picked up anyway.
+        """
+        _SERIALIZED.pop(jinx, None)
+
+    @_memoized
     def config(self):
         jinx = self.jinx
         data = {'options': {
-            key: asdict(conf.var) for key, conf in
-            jinx.__config__.items()}}
+            conf.name: conf.var.to_dict() for conf in
+            jinx.__config__.values()}}
         return data
 
-    @property
+    @_memoized
     def charmcraft(self):
         jinx = self.jinx
         data = {'type': 'charm',
                 'bases': [base.to_dict() for base in jinx.bases]}
         return data
 
-    @property
+    @_memoized
     def actions(self):
         jinx = self.jinx
         data = {}
@@ -516,7 +1900,7 @@ class Serializer:
             data.update(a.as_dict())
         return data
 
-    @property
+    @_memoized
     def metadata(self):
         jinx = self.jinx
         data = {'name': jinx.name}
@@ -528,32 +1912,67 @@ class Serializer:
             data['description'] = jinx.description
         if jinx.summary:
             data['summary'] = jinx.summary
+        if jinx.maintainer:
+            data['maintainer'] = jinx.maintainer
 
         if jinx.__provides__:
-            data['provides'] = {r.name: asdict(r.meta) for r in
+            data['provides'] = {r.name: r.meta.to_dict() for r in
                                 jinx.__provides__}
         if jinx.__requires__:
-            data['requires'] = {r.name: asdict(r.meta) for r in
+            data['requires'] = {r.name: r.meta.to_dict() for r in
                                 jinx.__requires__}
         if jinx.__peers__:
-            data['peers'] = {r.name: asdict(r.meta) for r in jinx.__peers__}
+            data['peers'] = {r.name: r.meta.to_dict() for r in jinx.__peers__}
 
         if jinx.__containers__:
-            data['containers'] = {c.name: asdict(c.meta) for c in
+            data['containers'] = {c.name: c.meta.to_dict() for c in
                                   jinx.__containers__}
         if jinx.__resources__:
             data['resources'] = {c.name: c.meta.to_dict() for c in
                                  jinx.__resources__}
         if jinx.__storage__:
-            data['storage'] = {c.name: asdict(c.meta) for c in
+            data['storage'] = {c.name: c.meta.to_dict() for c in
                                jinx.__storage__}
         return data
 
+    @_memoized
+    def charm_meta(self) -> CharmMeta:
+        """What ops would parse out of metadata.yaml and actions.yaml."""
+        return CharmMeta(self.metadata, self.actions)
 
-def harness(jinx: Type[Jinx]):
+
+@functools.lru_cache(maxsize=None)
+def _harness_type():
     from ops.testing import Harness
+
+    class JinxHarness(Harness):
+        """Harness also accepting already-parsed metadata and config.
+
+        ``meta`` may be a CharmMeta (which carries the actions too) and
+        ``config`` the config.yaml contents as a dict, as produced by
+        Serializer; both skip the YAML round trip.
+        """
+
+        def _create_meta(self, charm_metadata, action_metadata):
+            if isinstance(charm_metadata, CharmMeta):
+                return charm_metadata
+            return super()._create_meta(charm_metadata, action_metadata)
+
+        def _load_config_defaults(self, charm_config):
+            if isinstance(charm_config, dict):
+                return {key: option.get('default') for key, option in
+                        charm_config.get('options', {}).items()}
+            return super()._load_config_defaults(charm_config)
+
+        def _update_config(self, key_values=None, unset=()):
+            super()._update_config(key_values, unset)
+            if self._charm is not None:
+                self._charm._config_snapshot = None
+
+    return JinxHarness
+
+
+def harness(jinx: Type[Jinx]):
+    Harness = _harness_type()
     serializer = Serializer(jinx)
-    return Harness(jinx,
-                   meta=yaml.safe_dump(serializer.metadata),
-                   actions=yaml.safe_dump(serializer.actions),
-                   config=yaml.safe_dump(serializer.config))
+    return Harness(jinx, meta=serializer.charm_meta, config=serializer.config)
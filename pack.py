@@ -0,0 +1,548 @@
+#! /bin/python3
+"""Turn a charm's yaml files into the source of an equivalent Jinx.
+
+The inverse of unpack: ``pack path/to/charm`` writes a Jinx class declaring
+the charm's relations, containers, resources, storage, config options and
+actions. Whatever jinx can't express is left out and listed in a comment at
+the top of the file. The result is checked by serializing it back (see
+roundtrip).
+"""
+import keyword
+import multiprocessing
+import os
+import re
+import traceback
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import yaml
+
+from jinx import Jinx, Serializer
+from unpack import PRUNED_DIRS, get_static_jinx_class
+
+SECTIONS = ('metadata', 'config', 'actions', 'charmcraft')
+MAX_LINE = 79
+DEFAULT_OUTPUT = 'charm_jinx.py'
+
+# param constructor by type; other config/param types are left out
+PARAM_TYPES = {'string': 'string', 'integer': 'integer', 'float': 'float_'}
+# metadata.yaml sections with their declaration constructor
+RELATIONS = (('requires', 'require'), ('provides', 'provide'),
+             ('peers', 'peer'))
+# keys jinx reads, per kind of entry
+PARAM_KEYS = {'type', 'description', 'default'}
+RESOURCE_KEYS = {'type': 'type', 'description': 'description',
+                 'upstream-source': 'upstream_source'}
+STORAGE_KEYS = {'type', 'location'}
+PLATFORM_KEYS = {'name', 'channel'}
+# directories find_charms doesn't look into
+SKIPPED_DIRS = PRUNED_DIRS | {'build', 'venv', '.venv', 'node_modules'}
+
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class _Expr:
+    """A python expression, rendered to fit in a line where possible."""
+
+    def __init__(self, head: str = '', items: Sequence[Tuple[str, Any]] = (),
+                 close: str = ''):
+        # head + 'key' + item, ... + close; items are _Expr or literals
+        self.head = head
+        self.items = [(key, item if isinstance(item, _Expr)
+                       else _literal(item))
+                      for key, item in items]
+        self.close = close
+
+    def flat(self) -> str:
+        if not self.close:
+            return self.head
+        return self.head + ', '.join(
+            key + item.flat() for key, item in self.items) + self.close
+
+    def render(self, column: int, trail: int = 0) -> str:
+        """Render starting at ``column``, with ``trail`` characters (commas,
+        closing brackets) to follow on the last line; args are split one
+        per line and aligned with the opening bracket if they don't fit."""
+        flat = self.flat()
+        if column + len(flat) + trail <= MAX_LINE or not self.items:
+            return flat
+        inner = column + len(self.head)
+        last = len(self.items) - 1
+        return self.head + (',\n' + ' ' * inner).join(
+            key + item.render(inner + len(key),
+                              trail + len(self.close) if i == last else 1)
+            for i, (key, item) in enumerate(self.items)) + self.close
+
+
+class _Str(_Expr):
+    """A string literal, split into implicitly concatenated pieces (at
+    word boundaries where possible) if it doesn't fit."""
+
+    def __init__(self, value: str):
+        super().__init__(repr(value))
+        self.value = value
+
+    def render(self, column: int, trail: int = 0) -> str:
+        if column + len(self.head) + trail <= MAX_LINE:
+            return self.head
+        width = max(MAX_LINE - column - trail, 20)
+        pieces = ['']
+        for word in re.findall(r'\S*\s*', self.value):
+            while word:
+                if len(repr(pieces[-1] + word)) <= width:
+                    pieces[-1] += word
+                    break
+                if pieces[-1]:
+                    pieces.append('')
+                    continue
+                # a single word too long for a line: cut it
+                cut = len(word)
+                while cut > 1 and len(repr(word[:cut])) > width:
+                    cut -= 1
+                pieces[-1], word = word[:cut], word[cut:]
+                pieces.append('')
+        return ('\n' + ' ' * column).join(
+            repr(piece) for piece in pieces if piece)
+
+
+def _literal(value: Any) -> _Expr:
+    return _Str(value) if isinstance(value, str) else _Expr(repr(value))
+
+
+def _call(func: str, *args, **kwargs) -> _Expr:
+    """``func(*args, **kwargs)``, leaving out None keyword arguments."""
+    items = [('', a) for a in args]
+    items += [(f'{k}=', v) for k, v in kwargs.items() if v is not None]
+    return _Expr(f'{func}(', items, ')')
+
+
+def _mapping(dct: Mapping[str, Any]) -> _Expr:
+    """``dict(k=v)`` if the keys allow it, else a dict literal."""
+    if dct and all(k.isidentifier() and not keyword.iskeyword(k)
+                   for k in dct):
+        return _call('dict', **dct)
+    return _Expr('{', [(f'{k!r}: ', v) for k, v in dct.items()], '}')
+
+
+def _class_name(charm_name: str) -> str:
+    name = ''.join(part[:1].upper() + part[1:]
+                   for part in re.split(r'[^0-9a-zA-Z]+', charm_name))
+    if not name.isidentifier():
+        name = 'Charm' + name
+    return name
+
+
+class _Packer:
+    def __init__(self, sections: Mapping[str, Any]):
+        self.sections = sections
+        self.lines: List[str] = []
+        self.dropped: List[str] = []
+        self.attrs = set(dir(Jinx))
+
+    def drop(self, file: str, path: Sequence[Any]):
+        self.dropped.append(f'{file}.yaml: {".".join(map(str, path))}')
+
+    def extra_keys(self, file: str, path: Sequence[Any],
+                   entry: Mapping[str, Any], known):
+        for key in entry:
+            if key not in known:
+                self.drop(file, [*path, key])
+
+    def attr(self, name: str, kind: str) -> str:
+        """A free class attribute name for the ``kind`` entry ``name``."""
+        attr = re.sub(r'\W', '_', name)
+        if not attr.isidentifier() or keyword.iskeyword(attr):
+            attr = f'{kind}_{attr}'
+        if attr in self.attrs:
+            attr = f'{attr}_{kind}'
+        base, i = attr, 2
+        while attr in self.attrs:
+            attr, i = f'{base}{i}', i + 1
+        self.attrs.add(attr)
+        return attr
+
+    def declare(self, name: str, kind: str, func: str, *args, **kwargs):
+        attr = self.attr(name, kind)
+        if attr != name:
+            kwargs['name'] = name
+        line = f'    {attr} = '
+        self.lines.append(
+            line + _call(func, *args, **kwargs).render(len(line)))
+
+    def assign(self, attr: str, value: Any):
+        """``attr = value``; a string too long for a line is wrapped in
+        parentheses and split."""
+        line = f'    {attr} = '
+        rendered = _literal(value).render(len(line))
+        if '\n' in rendered:
+            rendered = '(' + _literal(value).render(len(line) + 1, 1) + ')'
+        self.lines.append(line + rendered)
+
+    def param(self, file: str, path: Sequence[Any],
+              spec: Mapping[str, Any]) -> Optional[_Expr]:
+        spec = spec or {}
+        func = PARAM_TYPES.get(spec.get('type'))
+        if func is None:
+            self.drop(file, path)
+            return None
+        self.extra_keys(file, path, spec, PARAM_KEYS)
+        args = [spec['description']] if spec.get('description') else []
+        return _call(func, *args, default=spec.get('default'))
+
+    def params(self, file: str, path: Sequence[Any],
+               specs: Mapping[str, Any]) -> Optional[_Expr]:
+        params = {}
+        for key, spec in (specs or {}).items():
+            param = self.param(file, [*path, key], spec)
+            if param is not None:
+                params[key] = param
+        return _mapping(params) if params else None
+
+    def header(self):
+        meta = self.sections.get('metadata') or {}
+        self.assign('name', meta.get('name'))
+        for key in ('summary', 'description', 'maintainer'):
+            if meta.get(key):
+                self.assign(key, meta[key])
+        if meta.get('subordinate'):
+            self.lines.append('    subordinate = True')
+
+        bases = self.bases()
+        if bases is not None:
+            line = '    bases = '
+            self.lines.append(line + _Expr('[', [('', b) for b in bases],
+                                           ']').render(len(line)))
+
+    def bases(self) -> Optional[List[_Expr]]:
+        charmcraft = self.sections.get('charmcraft') or {}
+        self.extra_keys('charmcraft', [], charmcraft, {'type', 'bases'})
+        if 'bases' not in charmcraft:
+            return None
+        bases = []
+        for i, base in enumerate(charmcraft['bases']):
+            if 'run-on' in base or 'build-on' in base:
+                self.extra_keys('charmcraft', ['bases', i], base,
+                                {'run-on', 'build-on'})
+                run_on = self.platforms(['bases', i, 'run-on'],
+                                        base.get('run-on', ()))
+                build_on = self.platforms(['bases', i, 'build-on'],
+                                          base.get('build-on', ()))
+            else:  # short form: one platform to build and run on
+                run_on = build_on = self.platforms(['bases', i], [base],
+                                                   indexed=False)
+            bases.append(_call('Base', run_on=run_on, build_on=build_on))
+        if [b.flat() for b in bases] == [
+                "Base(run_on=[Platform('ubuntu', '20.04')], "
+                "build_on=[Platform('ubuntu', '20.04')])"]:
+            return None  # jinx's default
+        return bases
+
+    def platforms(self, path: List[Any],
+                  platforms: Sequence[Mapping[str, str]],
+                  indexed: bool = True) -> _Expr:
+        items = []
+        for i, platform in enumerate(platforms):
+            self.extra_keys('charmcraft', [*path, i] if indexed else path,
+                            platform, PLATFORM_KEYS)
+            items.append(('', _call('Platform', platform.get('name'),
+                                    platform.get('channel'))))
+        return _Expr('[', items, ']')
+
+    def group(self, comment: str):
+        self.lines += ['', f'    # {comment}']
+
+    def metadata(self):
+        meta = self.sections.get('metadata') or {}
+        self.extra_keys('metadata', [], meta, {
+            'name', 'summary', 'description', 'maintainer', 'subordinate',
+            'requires', 'provides', 'peers', 'containers', 'resources',
+            'storage'})
+
+        if any(meta.get(section) for section, _ in RELATIONS):
+            self.group('relations')
+        for section, func in RELATIONS:
+            for name, spec in (meta.get(section) or {}).items():
+                path = [section, name]
+                self.extra_keys('metadata', path, spec,
+                                {'interface', 'schema'})
+                schema = spec.get('schema') or {}
+                self.extra_keys('metadata', [*path, 'schema'], schema,
+                                {'app', 'unit'})
+                self.declare(
+                    name, 'relation', func, spec.get('interface'),
+                    app=self.params('metadata', [*path, 'schema', 'app'],
+                                    schema.get('app')),
+                    unit=self.params('metadata', [*path, 'schema', 'unit'],
+                                     schema.get('unit')))
+
+        containers = meta.get('containers') or {}
+        if containers:
+            self.group('containers')
+        for name, spec in containers.items():
+            spec = spec or {}
+            if 'resource' not in spec:
+                self.drop('metadata', ['containers', name])
+                continue
+            self.extra_keys('metadata', ['containers', name], spec,
+                            {'resource'})
+            self.declare(name, 'container', 'container', spec['resource'])
+
+        resources = meta.get('resources') or {}
+        if resources:
+            self.group('resources')
+        for name, spec in resources.items():
+            self.extra_keys('metadata', ['resources', name], spec,
+                            RESOURCE_KEYS)
+            kwargs = {RESOURCE_KEYS[k]: v for k, v in spec.items()
+                      if k in RESOURCE_KEYS and v}
+            if kwargs.get('type') == 'oci-image':
+                del kwargs['type']
+            self.declare(name, 'resource', 'resource', **kwargs)
+
+        storages = meta.get('storage') or {}
+        if storages:
+            self.group('storage')
+        for name, spec in storages.items():
+            self.extra_keys('metadata', ['storage', name], spec, STORAGE_KEYS)
+            args = [spec.get('type')]
+            if spec.get('location') is not None:
+                args.append(spec['location'])
+            self.declare(name, 'storage', 'storage', *args)
+
+    def config(self):
+        config = self.sections.get('config') or {}
+        self.extra_keys('config', [], config, {'options'})
+        options = config.get('options') or {}
+        if options:
+            self.group('config')
+        for name, spec in options.items():
+            param = self.param('config', ['options', name], spec)
+            if param is not None:
+                self.declare(name, 'config', 'config', param)
+
+    def actions(self):
+        actions = self.sections.get('actions') or {}
+        if actions:
+            self.group('actions')
+        for name, spec in actions.items():
+            spec = spec or {}
+            self.extra_keys('actions', [name], spec, {'params'})
+            params = self.params('actions', [name, 'params'],
+                                 spec.get('params'))
+            if params is None:
+                self.declare(name, 'action', 'action')
+            else:
+                self.declare(name, 'action', 'action', params)
+
+    def source(self) -> str:
+        meta = self.sections.get('metadata') or {}
+        class_name = _class_name(meta.get('name') or 'charm')
+        self.header()
+        self.metadata()
+        self.config()
+        self.actions()
+
+        head = ['#!/usr/bin/env python3']
+        if self.dropped:
+            head += ['', '# not supported by jinx, left out:']
+            head += [f'#   {d}' for d in self.dropped]
+        return '\n'.join(head + [
+            '', 'from jinx import *', '', '',
+            f'class {class_name}(Jinx):',
+            *self.lines,
+            '',
+            '    def __init__(self, framework, key=None):',
+            '        super().__init__(framework, key)',
+            '', '',
+            "if __name__ == '__main__':",
+            '    from ops.main import main',
+            f'    main({class_name})',
+            ''])
+
+
+def load_sections(root: Union[str, Path]) -> Dict[str, Any]:
+    """The parsed yaml files of the charm in ``root``; missing ones are
+    left out. Raises RuntimeError without a metadata.yaml."""
+    root = Path(root)
+    sections = {}
+    for section in SECTIONS:
+        path = root / f'{section}.yaml'
+        if path.exists():
+            with open(path, 'rb') as f:
+                sections[section] = yaml.load(f, Loader=_Loader) or {}
+    if 'metadata' not in sections:
+        raise RuntimeError(f'no metadata.yaml in {root}')
+    return sections
+
+
+def pack(sections: Mapping[str, Any]) -> Tuple[str, List[str]]:
+    """Source of a Jinx declaring the charm described by ``sections``
+    (section name -> parsed yaml, see SECTIONS), and the (file: key.path)
+    entries it had to leave out."""
+    packer = _Packer(sections)
+    return packer.source(), packer.dropped
+
+
+def _diff(expected: Any, actual: Any, path: List[Any],
+          out: List[Tuple[str, str]]):
+    def empty(value):
+        return value is None or value is False or value in ('', {}, [])
+
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in expected.keys() | actual.keys():
+            where = [*path, key]
+            if key not in actual:
+                if not empty(expected[key]):
+                    out.append(('.'.join(map(str, where)), 'missing'))
+            elif key not in expected:
+                if not empty(actual[key]):
+                    out.append(('.'.join(map(str, where)),
+                                f'unexpected {actual[key]!r}'))
+            else:
+                _diff(expected[key], actual[key], where, out)
+    elif isinstance(expected, list) and isinstance(actual, list) and \
+            len(expected) == len(actual):
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            _diff(e, a, [*path, i], out)
+    elif expected != actual:
+        out.append(('.'.join(map(str, path)), f'{expected!r} != {actual!r}'))
+
+
+def _long_bases(charmcraft: Mapping[str, Any]) -> Mapping[str, Any]:
+    bases = [base if 'run-on' in base or 'build-on' in base else
+             {'run-on': [base], 'build-on': [base]}
+             for base in charmcraft.get('bases') or ()]
+    return {**charmcraft, 'bases': bases} if bases else charmcraft
+
+
+def roundtrip(sections: Mapping[str, Any], source: str,
+              dropped: Sequence[str] = ()) -> List[str]:
+    """Differences between ``sections`` and what Serializer makes of the
+    Jinx in ``source``, other than under the ``dropped`` keys."""
+    serializer = Serializer(get_static_jinx_class('charm_jinx.py', source))
+    mismatches = []
+    for section, expected in sections.items():
+        if section == 'charmcraft':
+            expected = _long_bases(expected)
+        out = []
+        _diff(expected, getattr(serializer, section), [], out)
+        for path, what in out:
+            key = f'{section}.yaml: {path}'
+            if not any(key == d or key.startswith(d + '.') for d in dropped):
+                mismatches.append(f'{key}: {what}')
+    return sorted(mismatches)
+
+
+@dataclass
+class PackResult:
+    root: Path
+    output: Path
+    dropped: List[str] = field(default_factory=list)
+    mismatches: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.mismatches
+
+
+def pack_charm(root: Union[str, Path], output: Union[str, Path] = None,
+               overwrite: bool = False, check: bool = True) -> PackResult:
+    """Write the Jinx for the charm in ``root`` to ``output`` (relative to
+    ``root``; defaults to DEFAULT_OUTPUT). With ``check``, the mismatches
+    found by roundtrip are reported in the result."""
+    root = Path(root)
+    output = root / (output or DEFAULT_OUTPUT)
+    result = PackResult(root, output)
+    if output.exists() and not overwrite:
+        result.error = f'{output} exists. pass --overwrite to overwrite'
+        return result
+    sections = load_sections(root)
+    source, result.dropped = pack(sections)
+    if check:
+        result.mismatches = roundtrip(sections, source, result.dropped)
+    output.write_text(source)
+    return result
+
+
+def find_charms(tree: Union[str, Path]) -> List[Path]:
+    """Directories under ``tree`` with a metadata.yaml, skipping tests,
+    virtualenvs and build directories."""
+    charms = []
+    for directory, dirnames, filenames in os.walk(tree):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIPPED_DIRS)
+        if 'metadata.yaml' in filenames:
+            charms.append(Path(directory))
+    return charms
+
+
+def _pack_job(job) -> PackResult:
+    root, kwargs = job
+    try:
+        return pack_charm(root, **kwargs)
+    except Exception:
+        return PackResult(root, root / (kwargs.get('output') or
+                                        DEFAULT_OUTPUT),
+                          error=traceback.format_exc())
+
+
+def pack_many(roots: Sequence[Union[str, Path]],
+              processes: Optional[int] = None,
+              **kwargs) -> List[PackResult]:
+    """pack_charm every root in a process pool; ``kwargs`` are passed on.
+    Failures are reported in the results rather than raised."""
+    tasks = [(Path(root), kwargs) for root in roots]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(_pack_job, tasks)
+
+
+def report(results: Sequence[PackResult]) -> str:
+    lines = []
+    for result in results:
+        if result.error is not None:
+            error = result.error.strip().splitlines()[-1]
+            lines.append(f'FAILED  {result.root}: {error}')
+            continue
+        status = 'ok' if result.ok else 'DIFFERS'
+        lines.append(f'{status:<8}{result.root} -> {result.output} '
+                     f'({len(result.dropped)} keys left out)')
+        lines += [f'          {m}' for m in result.mismatches]
+    failed = sum(not r.ok for r in results)
+    lines.append(f'{len(results) - failed} packed, {failed} failed')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    from typer import run, Argument, Exit, Option
+
+    def _pack(
+            path: Path = Argument(
+                ..., help='charm root folder; with --batch, a folder to '
+                          'search for charms.'),
+            output: str = Option(
+                DEFAULT_OUTPUT, help='file to write the jinx to, relative '
+                                     'to the charm root.'),
+            overwrite: bool = Option(
+                False, help='whether to overwrite an existing output file.'),
+            check: bool = Option(
+                True, help='serialize the jinx back and report any '
+                           'difference with the yaml files.'),
+            batch: bool = Option(
+                False, help='pack every charm (folder with a metadata.yaml) '
+                            'found under path, in parallel.'),
+            processes: Optional[int] = Option(
+                None, help='number of worker processes for --batch.')):
+        roots = find_charms(path) if batch else [path]
+        kwargs = dict(output=output, overwrite=overwrite, check=check)
+        if batch:
+            results = pack_many(roots, processes, **kwargs)
+        else:
+            results = [_pack_job((path, kwargs))]
+            for dropped in results[0].dropped:
+                print(f'left out: {dropped}')
+        print(report(results))
+        if not all(r.ok for r in results):
+            raise Exit(1)
+
+    run(_pack)
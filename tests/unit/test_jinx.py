@@ -1,14 +1,28 @@
+import asyncio
 import inspect
+import json
+import os
+import pickle
+import threading
+import time
+import types
+from dataclasses import FrozenInstanceError, asdict, fields
 
 import pytest
+import jinx
+import ops.model
+import ops.pebble
 import yaml
 from jinx import *
+from jinx import _Relation
+from ops.framework import StoredState
 from ops.testing import Harness
 
 class OldSchoolCharm(CharmBase):
     def __init__(self, framework, key=None):
         super().__init__(framework, key)
         self.framework.observe(self.on.db_relation_changed, self._on_db_changed)
+        self.framework.observe(self.on.get_data_action, self._handle_get_data)
         self.thing = self.config['thing']
         self.other_thing = self.config['other_thing']
 
@@ -161,3 +175,861 @@ def test_name_late_binding(constructor, kw_args, obj_name, metas):
 
     assert default_obj.name == 'default_name_obj'
     assert custom_obj.name == obj_name
+
+
+def test_bound_views_cached_per_instance():
+    class CachingJinx(Jinx):
+        name = 'my-charm'
+        db = require(interface='interface')
+        workload = container(resource='workload')
+        disk = storage('filesystem')
+
+    metas = {'requires': {'db': {'interface': 'interface'}},
+             'containers': {'workload': {'resource': 'workload'}},
+             'storage': {'disk': {'type': 'filesystem'}}}
+
+    first = Harness(CachingJinx, meta=yaml.safe_dump(metas))
+    first.begin()
+    second = Harness(CachingJinx, meta=yaml.safe_dump(metas))
+    second.begin()
+
+    for attr in ('db', 'workload', 'disk'):
+        bound = getattr(first.charm, attr)
+        assert getattr(first.charm, attr) is bound
+        assert vars(first.charm)[attr] is bound
+        # a rebuilt charm gets its own views
+        assert getattr(second.charm, attr) is not bound
+
+    # class-level access yields the declaration itself
+    assert isinstance(CachingJinx.db, _Relation)
+
+
+def test_bound_events_resolved_lazily():
+    class LazyJinx(Jinx):
+        name = 'my-charm'
+        db = require(interface='interface')
+
+    h = Harness(LazyJinx, meta=yaml.safe_dump(
+        {'requires': {'db': {'interface': 'interface'}}}))
+    h.begin()
+    bound = h.charm.db
+
+    assert not hasattr(bound, '__dict__')
+    with pytest.raises(AttributeError):
+        bound._created
+    assert bound.changed.event_kind == 'db_relation_changed'
+    assert bound.changed is bound.changed
+    with pytest.raises(AttributeError):
+        bound._created
+
+
+def test_registry_inherited():
+    class DbMixin:
+        db = require(interface='interface')
+
+    class Base(Jinx):
+        name = 'my-charm'
+        foo = config(string())
+        go = action()
+
+        @go.handler
+        def _on_go(self, event):
+            pass
+
+    class Child(DbMixin, Base):
+        bar = config(integer())
+        foo = None  # hides the parent's declaration
+
+    registry = Child.__jinx_registry__
+    assert list(registry.index) == ['go', 'db', 'bar']
+    assert dict(registry.handlers) == {'_on_go': Base.go}
+    assert registry.relations == (DbMixin.db,)
+    assert Child.__requires__ == [DbMixin.db]
+    assert list(Child.__config__) == ['bar']
+    assert list(Base.__config__) == ['foo']
+    assert Base.__requires__ == []
+    with pytest.raises(TypeError):
+        registry.index['baz'] = config(string())
+
+
+def test_config_snapshot():
+    class ConfigJinx(Jinx):
+        name = 'my-charm'
+        thing = config(string(default='foo'))
+        count = config(integer(default=1))
+        ratio = config(float_(default=1))
+        unset = config(string())
+
+    h = harness(ConfigJinx)
+    h.begin()
+    charm = h.charm
+
+    assert charm.thing == 'foo'
+    assert charm.ratio == 1.0 and isinstance(charm.ratio, float)
+    snapshot = charm._config_snapshot
+    assert charm.count == 1
+    assert charm._config_snapshot is snapshot
+    assert not hasattr(snapshot, '__dict__')
+    with pytest.raises(KeyError):
+        charm.unset
+
+    # config-changed drops the snapshot
+    h.update_config({'thing': 'bar', 'count': '3'})
+    assert charm.thing == 'bar'
+    assert charm.count == 3
+
+    # so does updating config with hooks disabled
+    h.disable_hooks()
+    h.update_config({'thing': 'baz'})
+    assert charm.thing == 'baz'
+
+
+def test_config_on_changed():
+    class ConfigJinx(Jinx):
+        name = 'my-charm'
+        thing = config(string(default='foo'))
+
+        def __init__(self, framework):
+            super().__init__(framework)
+            self.seen = []
+            self.config.on_changed(self._on_config_changed)
+
+        def _on_config_changed(self, event):
+            self.seen.append(self.thing)
+
+    h = harness(ConfigJinx)
+    h.begin()
+    h.update_config({'thing': 'bar'})
+    assert h.charm.seen == ['bar']
+    assert h.charm.config.changed.event_kind == 'config_changed'
+
+
+def test_serializer_memoized():
+    class MemoJinx(Jinx):
+        name = 'my-charm'
+        db = require(interface='interface')
+
+    meta = Serializer(MemoJinx).metadata
+    assert Serializer(MemoJinx).metadata is meta
+    assert meta['requires'] == {'db': {'interface': 'interface'}}
+
+    MemoJinx.summary = 'changed'
+    assert 'summary' not in Serializer(MemoJinx).metadata
+    Serializer.invalidate(MemoJinx)
+    assert Serializer(MemoJinx).metadata['summary'] == 'changed'
+
+
+# Time (ms) that executing jinx.py may add on top of importing ops, which
+# every hook pays. Compilation is excluded: deployed charms ship pycs.
+# about 2x the measured exec time of jinx.py (~1.6ms), to catch regressions
+IMPORT_BUDGET_MS = 4
+# wall-clock assertions flake on loaded machines; set this to run them
+TIMING_ENV = 'JINX_TIMING_TESTS'
+
+IMPORT_PROBE = """
+import importlib.util, sys, time
+import ops.charm
+
+spec = importlib.util.find_spec('jinx')
+code = spec.loader.get_code('jinx')
+module = importlib.util.module_from_spec(spec)
+sys.modules['jinx'] = module
+start = time.perf_counter()
+exec(code, module.__dict__)
+print((time.perf_counter() - start) * 1000)
+print(' '.join(sorted(sys.modules)))
+"""
+
+
+def _probe_import():
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    out = subprocess.run([sys.executable, '-c', IMPORT_PROBE],
+                         cwd=Path(__file__).parents[2], check=True,
+                         capture_output=True, text=True)
+    elapsed, modules = out.stdout.splitlines()
+    return float(elapsed), modules.split()
+
+
+def test_import_is_lazy():
+    _, modules = _probe_import()
+    # build and test tooling is only imported when used
+    for lazy in ('ops.testing', 'unpack', 'typer', 'asyncio',
+                 'multiprocessing'):
+        assert lazy not in modules
+
+
+@pytest.mark.skipif(not os.environ.get(TIMING_ENV),
+                    reason=f'wall-clock timing; set {TIMING_ENV}=1 to run')
+def test_import_budget():
+    assert min(_probe_import()[0] for _ in range(5)) < IMPORT_BUDGET_MS
+
+
+def test_observer_table():
+    class DecoratedJinx(Jinx):
+        name = 'my-charm'
+        db = require(interface='interface')
+        workload = container(resource='workload')
+        get_data = action()
+
+        def __init__(self, framework):
+            super().__init__(framework)
+            self.seen = []
+
+        @observe('start')
+        @db.on_changed
+        def _on_event(self, event):
+            self.seen.append(type(event).__name__)
+
+        @workload.on_pebble_ready
+        def _on_ready(self, event, extra=None):
+            self.seen.append('ready')
+
+        @get_data.handler
+        def _on_get_data(self, event):
+            return {'a': 'b'}
+
+    class ImperativeCharm(CharmBase):
+        def __init__(self, framework):
+            super().__init__(framework)
+            self.framework.observe(self.on.start, self._on_event)
+            self.framework.observe(self.on.db_relation_changed, self._on_event)
+            self.framework.observe(self.on.workload_pebble_ready,
+                                   self._on_ready)
+            self.framework.observe(self.on.get_data_action, self._on_get_data)
+
+        def _on_event(self, event):
+            pass
+
+        def _on_ready(self, event):
+            pass
+
+        def _on_get_data(self, event):
+            pass
+
+    hjinx = harness(DecoratedJinx)
+    hjinx.begin()
+    hcharm = Harness(ImperativeCharm,
+                     meta=yaml.safe_dump(Serializer(DecoratedJinx).metadata),
+                     actions=yaml.safe_dump(Serializer(DecoratedJinx).actions))
+    hcharm.begin()
+
+    def table(h):
+        return [(method, kind) for _, method, _, kind in
+                h.framework._observers]
+
+    assert table(hjinx) == table(hcharm)
+
+    hjinx.charm.on.start.emit()
+    rel_id = hjinx.add_relation('db', 'remote')
+    hjinx.add_relation_unit(rel_id, 'remote/0')
+    hjinx.update_relation_data(rel_id, 'remote/0', {'foo': 'bar'})
+    hjinx.container_pebble_ready('workload')
+    assert hjinx.charm.seen == ['StartEvent', 'RelationChangedEvent', 'ready']
+
+
+def test_observer_signature_checked_at_class_creation():
+    with pytest.raises(TypeError, match='extra required parameter'):
+        class BadJinx(Jinx):
+            name = 'my-charm'
+
+            @observe('start')
+            def _on_start(self, event, extra):
+                pass
+
+
+class ScopedJinx(Jinx):
+    name = 'my-charm'
+    dispatch_scoped = True
+    db = require(interface='interface')
+    get_data = action()
+
+    def __init__(self, framework, key=None):
+        super().__init__(framework, key)
+        self.seen = []
+        self.on_start(self._on_start)
+        self.on_update_status(self._on_event)
+
+    def _on_start(self, event):
+        if not self.model.relations['db']:
+            event.defer()
+            return
+        self.seen.append('start')
+
+    def _on_event(self, event):
+        self.seen.append(type(event).__name__)
+
+    @db.on_changed
+    def _on_db_changed(self, event):
+        self.seen.append('db_changed')
+
+    @get_data.handler
+    def _on_get_data(self, event):
+        return {'a': 'b'}
+
+
+@pytest.mark.parametrize('dispatch_path, kinds', (
+        ('hooks/update-status', ['update_status']),
+        ('hooks/db-relation-changed', ['db_relation_changed']),
+        ('actions/get-data', ['get_data_action']),
+        ('hooks/install', []),
+))
+def test_dispatch_scoped_observers(monkeypatch, dispatch_path, kinds):
+    monkeypatch.setenv('JUJU_DISPATCH_PATH', dispatch_path)
+    h = harness(ScopedJinx)
+    h.begin()
+    assert [kind for *_, kind in h.framework._observers] == kinds
+
+
+def test_dispatch_scoping_is_opt_in(monkeypatch):
+    class UnscopedJinx(ScopedJinx):
+        dispatch_scoped = Jinx.dispatch_scoped
+
+    monkeypatch.setenv('JUJU_DISPATCH_PATH', 'hooks/install')
+    h = harness(UnscopedJinx)
+    h.begin()
+    assert h.charm._dispatch_kinds is None
+    assert len(h.framework._observers) == 4
+
+
+def _dispatch(monkeypatch, h, cls, dispatch_path, emit=None):
+    """Run one Juju dispatch the way ops.main does: a new charm on a new
+    framework over the harness' storage, re-emitting deferred events
+    first and committing at the end."""
+    monkeypatch.setenv('JUJU_DISPATCH_PATH', dispatch_path)
+    framework = Framework(h.framework._storage, h.framework.charm_dir,
+                          h.framework.meta, h.model)
+    # as in Harness.begin: charm init defines the relation events on
+    # type(charm.on), so each charm needs an events class of its own
+    events = type(type(cls.on).__name__, (type(cls.on),), {})()
+    charm = type(cls.__name__, (cls,), {'on': events})(framework)
+    framework.reemit()
+    if emit is not None:
+        emit(charm)
+    framework.commit()
+    return charm
+
+
+def test_dispatch_scoping_keeps_deferred(monkeypatch):
+    h = harness(ScopedJinx)
+    h.begin()
+    h.charm.on.start.emit()
+    assert h.charm.seen == []
+
+    # the deferred start observer must be wired again for reemit to work
+    h.add_relation('db', 'remote')
+    charm = _dispatch(monkeypatch, h, ScopedJinx, 'hooks/update-status',
+                      lambda c: c.on.update_status.emit())
+    assert charm._dispatch_kinds == {'update_status', 'start'}
+    assert charm.seen == ['start', 'UpdateStatusEvent']
+
+
+class EquivalenceJinx(Jinx):
+    name = 'my-charm'
+    db = require(interface='interface')
+    thing = config(string(default='foo'))
+    _stored = StoredState()
+    calls = []  # (handler, what it saw), across dispatches
+
+    def __init__(self, framework, key=None):
+        super().__init__(framework, key)
+        self._stored.set_default(changes=0)
+        self.on_start(self._on_start)
+        self.on_config_changed(self._on_config_changed)
+        self.on_update_status(self._on_update_status)
+
+    def _on_start(self, event):
+        if not self.model.relations['db']:
+            self.calls.append(('start', 'deferred'))
+            event.defer()
+            return
+        self.calls.append(('start', 'ran'))
+
+    def _on_config_changed(self, event):
+        self.calls.append(('config_changed', self.model.config['thing']))
+
+    def _on_update_status(self, event):
+        self.calls.append(('update_status', self._stored.changes))
+
+    @db.on_changed
+    def _on_db_changed(self, event):
+        self._stored.changes += 1
+        n = event.relation.data[event.app].get('n', '')
+        self.calls.append(('db_changed', n))
+        event.relation.data[self.unit]['seen'] = n
+
+
+def _run_dispatches(monkeypatch, scoped: bool):
+    cls = type('EquivalenceJinx', (EquivalenceJinx,),
+               {'dispatch_scoped': scoped, 'calls': []})
+    h = harness(cls)
+    charms = []
+
+    def dispatch(path, emit=None):
+        charms.append(_dispatch(monkeypatch, h, cls, path, emit))
+
+    def relation_changed(charm):
+        relation = charm.model.get_relation('db', rel_id)
+        charm.on.db_relation_changed.emit(relation, relation.app)
+
+    dispatch('hooks/install', lambda c: c.on.install.emit())
+    dispatch('hooks/start', lambda c: c.on.start.emit())
+    h.update_config({'thing': 'bar'})
+    dispatch('hooks/config-changed', lambda c: c.on.config_changed.emit())
+    rel_id = h.add_relation('db', 'remote')
+    h.add_relation_unit(rel_id, 'remote/0')
+    h.update_relation_data(rel_id, 'remote', {'n': '1'})
+    dispatch('hooks/db-relation-changed', relation_changed)
+    dispatch('hooks/update-status', lambda c: c.on.update_status.emit())
+    h.update_relation_data(rel_id, 'remote', {'n': '2'})
+    dispatch('hooks/db-relation-changed', relation_changed)
+    dispatch('hooks/update-status', lambda c: c.on.update_status.emit())
+
+    assert all((c._dispatch_kinds is not None) == scoped for c in charms)
+    return (cls.calls, charms[-1]._stored.changes,
+            dict(h.get_relation_data(rel_id, 'my-charm/0')))
+
+
+def test_dispatch_scoping_is_equivalent(monkeypatch):
+    scoped = _run_dispatches(monkeypatch, scoped=True)
+    assert scoped == _run_dispatches(monkeypatch, scoped=False)
+    # the deferred start is re-emitted at every dispatch until it runs
+    assert scoped == ([('start', 'deferred'),
+                       ('start', 'deferred'),
+                       ('config_changed', 'bar'),
+                       ('start', 'ran'),
+                       ('db_changed', '1'),
+                       ('update_status', 1),
+                       ('db_changed', '2'),
+                       ('update_status', 2)],
+                      2, {'seen': '2'})
+
+
+def test_declarations_are_slotted_values():
+    param = string('a param', default='foo')
+    assert param is string('a param', default='foo')
+    assert float_(default=1) is not float_(default=1.0)
+    assert not hasattr(param, '__dict__')
+    with pytest.raises(FrozenInstanceError):
+        param.default = 'bar'
+    assert pickle.loads(pickle.dumps(param)) == param
+    assert [f.name for f in fields(param)] == ['type', 'description',
+                                               'default']
+    assert asdict(param) == param.to_dict()
+
+    first, second = action({'foo': param}), action({'foo': param})
+    assert first.meta is second.meta
+    assert {first.meta, second.meta} == {first.meta}
+    with pytest.raises(TypeError):
+        first.meta.params['bar'] = param
+    assert asdict(first.meta) == first.meta.to_dict() == {
+        'params': {'foo': {'type': 'string', 'description': 'a param',
+                           'default': 'foo'}}}
+    # nested values are told apart by type too
+    as_int = action({'x': float_(default=1)})
+    as_float = action({'x': float_(default=1.0)})
+    assert as_int.meta is not as_float.meta
+    assert repr(as_float.meta.to_dict()['params']['x']['default']) == '1.0'
+
+    for decl in (require('interface'), container('resource'), first,
+                 resource(), storage('filesystem'), config(param)):
+        assert not hasattr(decl, '__dict__')
+
+
+def test_profile(monkeypatch, tmp_path):
+    monkeypatch.setenv('JINX_PROFILE', 'file')
+
+    class ProfiledJinx(Jinx):
+        name = 'my-charm'
+        db = require(interface='interface')
+        thing = config(string(default='foo'))
+        get_data = action()
+
+        def __init__(self, framework, key=None):
+            super().__init__(framework, key)
+            self.on_start(self._on_start)
+
+        def _on_start(self, event):
+            assert self.thing == 'foo'
+
+        @db.on_changed
+        def _on_db_changed(self, event):
+            pass
+
+        @get_data.handler
+        def _on_get_data(self, event):
+            return {'a': 'b'}
+
+    h = harness(ProfiledJinx)
+    h.begin()
+    h.framework.charm_dir = tmp_path
+    h.charm.on.start.emit()
+    h.charm.db.changed
+    # Harness can't run actions: call the handler as the framework would
+    event = type('Event', (), {'set_results': lambda self, r: None})()
+    getattr(h.charm, '_on_get_data')(event)
+    h.framework.commit()
+
+    report = json.loads((tmp_path / '.jinx-profile.jsonl').read_text())
+    assert report['charm'] == 'ProfiledJinx'
+    assert [(t['phase'], t['name']) for t in report['timings']] == [
+        ('registry', 'ProfiledJinx'),
+        ('init', 'ProfiledJinx'),
+        ('config', 'snapshot'),
+        ('handler', 'ProfiledJinx._on_start'),
+        ('descriptor', 'db'),
+        ('event', 'db_relation_changed'),
+        ('action', 'test_profile.<locals>.ProfiledJinx._on_get_data'),
+        ('handler', 'ProfiledJinx._on_get_data'),
+    ]
+
+
+class FakeActionEvent:
+    """What action handlers use of an ActionEvent; Harness can't run them."""
+
+    def __init__(self):
+        self.results = self.failure = None
+        self.logs = []
+
+    def set_results(self, results):
+        self.results = results
+
+    def fail(self, message=''):
+        self.failure = message
+
+    def log(self, message):
+        self.logs.append(message)
+
+
+def test_async_action_handler():
+    barrier = threading.Barrier(2, timeout=5)
+
+    class AsyncJinx(Jinx):
+        name = 'my-charm'
+        backup = action()
+        slow = action(timeout=0.01)
+
+        @backup.handler
+        async def _on_backup(self, event):
+            # both calls must be in flight at once to pass the barrier
+            return await fan_out(event, {'a': barrier.wait,
+                                         'b': barrier.wait})
+
+        @slow.handler
+        async def _on_slow(self, event):
+            await asyncio.sleep(5)
+
+    h = harness(AsyncJinx)
+    h.begin()
+
+    event = FakeActionEvent()
+    getattr(h.charm, '_on_backup')(event)
+    assert set(event.results) == {'a', 'b'}
+    assert [log[:5] for log in event.logs] == ['[1/2]', '[2/2]']
+
+    event = FakeActionEvent()
+    getattr(h.charm, '_on_slow')(event)
+    assert event.failure == 'timed out after 0.01s'
+    assert event.results is None
+
+
+def test_async_action_timeout_abandons_blocking_calls():
+    class BlockedJinx(Jinx):
+        name = 'my-charm'
+        stuck = action(timeout=0.2)
+
+        @stuck.handler
+        async def _on_stuck(self, event):
+            await fan_out(event, {'a': lambda: time.sleep(3)})
+
+    h = harness(BlockedJinx)
+    h.begin()
+    event = FakeActionEvent()
+    start = time.perf_counter()
+    getattr(h.charm, '_on_stuck')(event)
+    assert time.perf_counter() - start < 1
+    assert event.failure == 'timed out after 0.2s'
+
+
+def test_fan_out_raises_first_failure():
+    def boom():
+        raise ValueError('boom')
+
+    event = FakeActionEvent()
+    with pytest.raises(ValueError, match='boom'):
+        asyncio.run(fan_out(event, {'ok': lambda: 1, 'boom': boom}, limit=1))
+    assert event.logs == ['[1/2] ok done', '[2/2] boom failed: boom']
+
+
+class ContainerJinx(Jinx):
+    name = 'my-charm'
+    workload = container(resource='workload')
+    workload_image = resource(name='workload')
+
+
+def test_bound_container():
+    h = harness(ContainerJinx)
+    h.begin()
+    workload = h.charm.workload
+    assert workload.container is h.charm.unit.get_container('workload')
+    assert workload.pebble is workload.container.pebble
+
+    assert workload.plan is workload.plan
+    workload.add_layer('base', {'services': {'srv': {
+        'override': 'replace', 'command': '/bin/srv'}}})
+    assert list(workload.plan.services) == ['srv']
+
+    workload.push_many({'/etc/a': 'foo', '/etc/b': b'bar'}, make_dirs=True)
+    assert workload.container.pull('/etc/a').read() == 'foo'
+    assert workload.container.pull('/etc/b').read() == 'bar'
+
+
+def test_push_many_single_request(monkeypatch):
+    class Response:
+        headers = {'Content-Type': 'application/json'}
+
+        def read(self):
+            return json.dumps({'result': [{'path': '/etc/a'},
+                                          {'path': '/etc/b'}]}).encode()
+
+    class Client(ops.pebble.Client):
+        requests = []
+
+        def _request_raw(self, method, path, query, headers, data):
+            self.requests.append(data)
+            return Response()
+
+    h = harness(ContainerJinx)
+    h.begin()
+    workload = h.charm.workload
+    workload.container._pebble = Client(socket_path='/no/such/socket')
+    workload.push_many({'/etc/a': 'foo', '/etc/b': b'bar'}, permissions=0o600)
+
+    body, = Client.requests
+    request = json.loads(body.split(b'\r\n')[4])
+    assert request == {'action': 'write', 'files': [
+        {'path': '/etc/a', 'permissions': '600'},
+        {'path': '/etc/b', 'permissions': '600'}]}
+    assert b'filename="/etc/a"\r\n\r\nfoo\r\n' in body
+    assert b'filename="/etc/b"\r\n\r\nbar\r\n' in body
+
+    # on an ops release it wasn't written for, files are pushed one by one
+    pushed = []
+    monkeypatch.setattr(ops, '__version__', '9.0.0')
+    monkeypatch.setattr(Client, 'push', lambda self, path, *_, **__:
+                        pushed.append(path))
+    workload.push_many({'/etc/a': 'foo', '/etc/b': b'bar'})
+    assert len(Client.requests) == 1
+    assert pushed == ['/etc/a', '/etc/b']
+
+
+def test_exec_many_overlaps():
+    calls = []
+
+    class Process:
+        def __init__(self, command):
+            self.command = command
+
+        def wait_output(self):
+            calls.append(('wait', self.command[0]))
+            return self.command[0], None
+
+    class Container:
+        def exec(self, command, **kwargs):
+            calls.append(('exec', command[0]))
+            return Process(command)
+
+    h = harness(ContainerJinx)
+    h.begin()
+    workload = h.charm.workload
+    workload._container = Container()
+    assert workload.exec_many([['a'], ['b']]) == [('a', None), ('b', None)]
+    assert calls == [('exec', 'a'), ('exec', 'b'), ('wait', 'a'), ('wait', 'b')]
+
+
+def test_exec_many_cleans_up_on_start_failure():
+    calls = []
+
+    class Process:
+        def __init__(self, command):
+            self.command = command
+
+        def send_signal(self, sig):
+            calls.append((sig, self.command[0]))
+
+        def wait(self):
+            calls.append(('wait', self.command[0]))
+
+    class Container:
+        def exec(self, command, **kwargs):
+            if command[0] == 'missing':
+                raise ops.pebble.APIError({}, 400, 'Bad Request',
+                                          'no such file')
+            return Process(command)
+
+    h = harness(ContainerJinx)
+    h.begin()
+    workload = h.charm.workload
+    workload._container = Container()
+    with pytest.raises(ops.pebble.APIError):
+        workload.exec_many([['a'], ['b'], ['missing'], ['c']])
+    assert calls == [('SIGKILL', 'a'), ('wait', 'a'),
+                     ('SIGKILL', 'b'), ('wait', 'b')]
+
+
+class DatabagJinx(Jinx):
+    name = 'my-charm'
+    db = require(interface='interface')
+
+
+def test_databag_staged_writes():
+    h = harness(DatabagJinx)
+    h.begin()
+    rel_id = h.add_relation('db', 'remote')
+    h.add_relation_unit(rel_id, 'remote/0')
+    h.update_relation_data(rel_id, 'remote/0', {'host': 'h', 'port': '1'})
+    h.update_relation_data(rel_id, 'my-charm/0', {'kept': 'x', 'gone': 'y'})
+
+    db = h.charm.db
+    remote = db.remote_databags()
+    assert dict(remote[h.model.get_unit('remote/0')]) == {'host': 'h',
+                                                          'port': '1'}
+
+    local = db.databag(h.charm.unit)
+    assert local is db.databag(h.charm.unit)
+    local['kept'] = 'x'
+    local['new'] = 'z'
+    del local['gone']
+    assert dict(local) == {'kept': 'x', 'new': 'z'}
+    assert local.changes() == {'new': 'z', 'gone': ''}
+    # nothing is written before commit
+    assert h.get_relation_data(rel_id, 'my-charm/0') == {'kept': 'x',
+                                                         'gone': 'y'}
+
+    h._get_backend_calls(reset=True)
+    h.framework.commit()
+    assert h.get_relation_data(rel_id, 'my-charm/0') == {'kept': 'x',
+                                                         'new': 'z'}
+    assert [c[0] for c in h._get_backend_calls()].count('relation_set') == 2
+
+    # unchanged values are not written again
+    local['new'] = 'z'
+    h._get_backend_calls(reset=True)
+    h.charm.flush_databags()
+    assert 'relation_set' not in [c[0] for c in h._get_backend_calls()]
+
+    # writes the unit can't make fail right away, not at commit
+    with pytest.raises(RelationDataError, match='remote/0'):
+        remote[h.model.get_unit('remote/0')]['host'] = 'mine'
+    with pytest.raises(RelationDataError, match='my-charm'):
+        db.databag(h.charm.app)['key'] = 'not leader'
+
+
+def test_databag_flushed_in_one_call(monkeypatch):
+    calls = []
+
+    class Backend(ops.model._ModelBackend):
+        def _run(self, *args, **kwargs):
+            calls.append(args)
+
+    content = ops.model.RelationDataContent(
+        types.SimpleNamespace(id=3), types.SimpleNamespace(name='app/0'),
+        Backend(unit_name='app/0'))
+    content._lazy_data = {'b': 'old'}
+    jinx._relation_set(content, {'a': '1', 'b': ''})
+    assert calls == [('relation-set', '-r', '3', 'a=1', 'b=')]
+    assert content._lazy_data == {'a': '1'}
+
+    app_content = ops.model.RelationDataContent(
+        types.SimpleNamespace(id=3), types.SimpleNamespace(name='app'),
+        Backend(unit_name='app/0'))
+    app_content._is_app = True
+    app_content._is_mutable = lambda: True
+    monkeypatch.setenv('JUJU_VERSION', '2.6.0')
+    with pytest.raises(RuntimeError, match='not supported on Juju version'):
+        jinx._relation_set(app_content, {'a': '1', 'b': '2'})
+    monkeypatch.setenv('JUJU_VERSION', '2.9.0')
+    jinx._relation_set(app_content, {'a': '1', 'b': '2'})
+    assert calls[-1] == ('relation-set', '-r', '3', 'a=1', 'b=2', '--app')
+
+
+def test_databag_schema():
+    class SchemaJinx(Jinx):
+        name = 'my-charm'
+        db = require(interface='pgsql',
+                     app={'host': string(), 'port': integer(default=5432)},
+                     unit={'ingress-address': string(), 'load': float_()})
+
+    assert Serializer(SchemaJinx).metadata['requires']['db'] == {
+        'interface': 'pgsql',
+        'schema': {
+            'app': {'host': {'type': 'string', 'description': '',
+                             'default': None},
+                    'port': {'type': 'integer', 'description': '',
+                             'default': 5432}},
+            'unit': {'ingress-address': {'type': 'string', 'description': '',
+                                         'default': None},
+                     'load': {'type': 'float', 'description': '',
+                              'default': None}}}}
+
+    h = harness(SchemaJinx)
+    h.begin()
+    h.set_leader(True)
+    rel_id = h.add_relation('db', 'remote')
+    h.add_relation_unit(rel_id, 'remote/0')
+    h.update_relation_data(rel_id, 'remote', {'host': 'db.local'})
+    h.update_relation_data(rel_id, 'remote/0', {'load': 'lots'})
+
+    db = h.charm.db
+    remote_app = db.relation.app
+    app = db.read(remote_app)
+    assert (app.host, app.port) == ('db.local', 5432)
+    assert db.read(remote_app) is app
+    with pytest.raises(RelationDataError, match="load: invalid float: 'lots'"):
+        db.read(h.model.get_unit('remote/0'))
+
+    db.write(h.charm.unit, ingress_address='10.0.0.1', load=0.5)
+    assert db.read(h.charm.unit).load == 0.5
+    db.write(h.charm.app, port=5433)
+    h.framework.commit()
+    assert h.get_relation_data(rel_id, 'my-charm/0') == {
+        'ingress-address': '10.0.0.1', 'load': '0.5'}
+    assert h.get_relation_data(rel_id, 'my-charm') == {'port': '5433'}
+
+    with pytest.raises(RelationDataError, match='port: invalid integer'):
+        db.write(h.charm.app, port='5432')
+    with pytest.raises(TypeError, match='unknown db databag fields: hots'):
+        db.write(h.charm.app, hots='x')
+
+
+def test_databag_records_follow_events():
+    class SchemaJinx(Jinx):
+        name = 'my-charm'
+        db = require(interface='pgsql', app={'n': integer()},
+                     unit={'seen': integer()})
+
+        def __init__(self, framework, key=None):
+            super().__init__(framework, key)
+            self.seen = []
+
+        @db.on_changed
+        def _on_db_changed(self, event):
+            self.seen.append(self.db.read(event.app).n)
+
+    h = harness(SchemaJinx)
+    h.begin()
+    rel_id = h.add_relation('db', 'remote')
+    h.add_relation_unit(rel_id, 'remote/0')
+    h.update_relation_data(rel_id, 'remote', {'n': '1'})
+    h.update_relation_data(rel_id, 'remote', {'n': '2'})
+    assert h.charm.seen == [1, 2]
+    db = h.charm.db
+    assert db.read(db.relation.app).n == 2
+
+    # writes through the databag are seen too
+    unit = db.databag(h.charm.unit)
+    assert db.read(h.charm.unit).seen is None
+    unit['seen'] = '3'
+    assert db.read(h.charm.unit).seen == 3
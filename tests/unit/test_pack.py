@@ -0,0 +1,123 @@
+from pathlib import Path
+from tempfile import mkdtemp
+
+import yaml
+
+from jinx import Serializer
+from pack import (find_charms, load_sections, pack, pack_charm, pack_many,
+                  report, roundtrip)
+from unpack import get_jinx_class, get_static_jinx_class, unpack
+
+TEMPLATE = Path(__file__).parents[2] / 'resources' / 'template_jinx.py'
+
+METADATA = {
+    'name': 'my-db',
+    'summary': 'a database',
+    'description': 'a database, ' * 10,
+    'maintainers': ['someone@example.com'],
+    'requires': {'ingress': {'interface': 'ingress', 'limit': 1}},
+    'provides': {'db-admin': {'interface': 'pgsql', 'schema': {
+        'app': {'host': {'type': 'string'},
+                'port': {'type': 'integer', 'default': 5432}}}}},
+    'peers': {'replicas': {'interface': 'db-peers'}},
+    'containers': {'workload': {'resource': 'image',
+                                'mounts': [{'storage': 'data'}]}},
+    'resources': {'image': {'type': 'oci-image',
+                            'upstream-source': 'db:latest'}},
+    'storage': {'data': {'type': 'filesystem', 'location': '/data'}},
+}
+CONFIG = {'options': {
+    'port': {'type': 'integer', 'description': 'the port to listen on. ' * 5,
+             'default': 5432},
+    'name': {'type': 'string', 'description': 'a name clashing with Jinx'},
+    'ratio': {'type': 'float', 'default': 0.5},
+    'debug': {'type': 'boolean', 'default': False},
+}}
+ACTIONS = {
+    'backup': {'description': 'back it up',
+               'params': {'target-dir': {'type': 'string'},
+                          'compress': {'type': 'boolean'}}},
+    'restart': {},
+}
+CHARMCRAFT = {'type': 'charm', 'parts': {'charm': {}},
+              'bases': [{'name': 'ubuntu', 'channel': '22.04'}]}
+SECTIONS = {'metadata': METADATA, 'config': CONFIG, 'actions': ACTIONS,
+            'charmcraft': CHARMCRAFT}
+
+
+def _write(root: Path, sections):
+    root.mkdir(parents=True, exist_ok=True)
+    for section, data in sections.items():
+        (root / f'{section}.yaml').write_text(yaml.safe_dump(data))
+
+
+def test_pack():
+    source, dropped = pack(SECTIONS)
+    assert dropped == [
+        'charmcraft.yaml: parts',
+        'metadata.yaml: maintainers',
+        'metadata.yaml: requires.ingress.limit',
+        'metadata.yaml: containers.workload.mounts',
+        'config.yaml: options.debug',
+        'actions.yaml: backup.description',
+        'actions.yaml: backup.params.compress']
+    for line in dropped:
+        assert f'#   {line}\n' in source
+    assert 'class MyDb(Jinx):' in source
+    assert "    db_admin = provide('pgsql',\n" in source
+    assert "    name_config = config(string('a name clashing with Jinx'), " \
+           "name='name')\n" in source
+    assert "    backup = action({'target-dir': string()})" in source
+    assert "    restart = action()" in source
+    assert all(len(line) <= 79 for line in source.splitlines()
+               if not line.startswith('#'))
+
+    assert roundtrip(SECTIONS, source, dropped) == []
+    assert 'metadata.yaml: requires.ingress.limit: missing' in roundtrip(
+        SECTIONS, source)
+    # the skeleton also imports and unpacks to the same sections
+    path = Path(mkdtemp()) / 'charm.py'
+    path.write_text(source)
+    imported = Serializer(get_jinx_class(path))
+    static = Serializer(get_static_jinx_class(path))
+    assert imported.metadata == static.metadata
+    assert imported.charmcraft['bases'] == [{
+        'run-on': [{'name': 'ubuntu', 'channel': '22.04'}],
+        'build-on': [{'name': 'ubuntu', 'channel': '22.04'}]}]
+
+
+def test_pack_roundtrips_unpack():
+    tempdir = Path(mkdtemp())
+    unpack(TEMPLATE, root=tempdir)
+    sections = load_sections(tempdir)
+
+    source, dropped = pack(sections)
+    assert dropped == []
+    assert roundtrip(sections, source) == []
+    static = Serializer(get_static_jinx_class(TEMPLATE))
+    for section in sections:
+        packed = Serializer(get_static_jinx_class('charm.py', source))
+        assert getattr(packed, section) == getattr(static, section)
+
+
+def test_pack_many():
+    tree = Path(mkdtemp())
+    _write(tree / 'charms' / 'db', SECTIONS)
+    (tree / 'charms' / 'template').mkdir(parents=True)
+    unpack(TEMPLATE, root=tree / 'charms' / 'template')
+    _write(tree / 'charms' / 'db' / 'tests' / 'tester', SECTIONS)
+    (tree / 'charms' / 'broken').mkdir()
+    (tree / 'charms' / 'broken' / 'metadata.yaml').write_text('[')
+
+    roots = find_charms(tree)
+    assert [r.name for r in roots] == ['broken', 'db', 'template']
+    results = pack_many(roots, processes=2)
+    by_root = {r.root.name: r for r in results}
+    assert 'ParserError' in by_root['broken'].error
+    assert by_root['db'].ok and len(by_root['db'].dropped) == 7
+    assert by_root['template'].ok
+    assert (tree / 'charms' / 'db' / 'charm_jinx.py').exists()
+    assert report(results).endswith('2 packed, 1 failed')
+
+    result = pack_charm(tree / 'charms' / 'db')
+    assert 'pass --overwrite' in result.error
@@ -22,3 +22,24 @@ def test_events():
     charm.on.install.emit()
     assert_status_event('install')
 
+
+
+def test_harness_skips_yaml(monkeypatch):
+    import yaml
+
+    def fail(*args, **kwargs):
+        raise AssertionError('yaml round trip')
+
+    monkeypatch.setattr(yaml, 'safe_dump', fail)
+    monkeypatch.setattr(yaml, 'safe_load', fail)
+
+    first = harness(MyCharm)
+    second = harness(MyCharm)
+    assert first.model is not second.model
+    assert first._meta is second._meta
+    assert first._meta.name == 'my-charm'
+    assert set(first._meta.relations) == {'db-interface', 'db-replicas'}
+    assert set(first._meta.actions) == {'log-me'}
+
+    first.begin()
+    first.charm.on.start.emit()
@@ -1,3 +1,6 @@
+import subprocess
+import sys
+
 import pytest
 import yaml
 
@@ -5,7 +8,10 @@ from jinx import *
 from pathlib import Path
 from tempfile import mkdtemp
 
-from unpack import unpack
+from unpack import (unpack, get_jinx_class, get_static_jinx_class,
+                    load_jinx_module, dump_all,
+                    Unresolvable, expand_jobs, unpack_many, report, Watcher,
+                    _module_name)
 
 META = {'name': 'my-charm',
         'requires': {'db': {'interface': 'interface'}},
@@ -105,3 +111,450 @@ def test_unpack_include():
     jinxtest = path_to_jinx_file.parent / 'test_jinx.py'
     unpack(path_to_jinx_file, root=tempdir, include=[jinxtest])
     assert (tempdir / 'src' / 'test_jinx.py').exists()
+
+
+def test_unpack_incremental():
+    tempdir = Path(mkdtemp())
+    path_to_jinx_file = Path(__file__).absolute()
+
+    changed = unpack(path_to_jinx_file, root=tempdir, incremental=True)
+    assert changed == ['metadata.yaml', 'actions.yaml', 'config.yaml',
+                       'charmcraft.yaml', 'src/charm.py']
+    mtimes = {p: p.stat().st_mtime_ns for p in tempdir.rglob('*')}
+
+    changed = unpack(path_to_jinx_file, root=tempdir, overwrite=True,
+                     incremental=True)
+    assert changed == []
+    assert mtimes == {p: p.stat().st_mtime_ns for p in tempdir.rglob('*')}
+
+    (tempdir / 'config.yaml').write_text('stale')
+    changed = unpack(path_to_jinx_file, root=tempdir, overwrite=True,
+                     incremental=True)
+    assert changed == ['config.yaml']
+    assert yaml.safe_load((tempdir / 'config.yaml').read_text()) == CONFIG
+
+
+def test_unpack_shared_metadata_has_no_aliases():
+    class SharedJinx(Jinx):
+        name = 'my-charm'
+        x = config(string())
+        y = config(string())
+
+    tempdir = Path(mkdtemp())
+    dump_all(SharedJinx, tempdir)
+    text = (tempdir / 'config.yaml').read_text()
+    assert '&' not in text and '*' not in text
+    assert yaml.safe_load(text)['options']['y'] == {
+        'type': 'string', 'description': '', 'default': None}
+
+
+def test_unpack_config_name_and_maintainer():
+    class RenamedJinx(Jinx):
+        name = 'my-charm'
+        maintainer = 'someone@example.com'
+        name_config = config(string('clashes with Jinx.name'), name='name')
+
+    tempdir = Path(mkdtemp())
+    dump_all(RenamedJinx, tempdir)
+    meta = yaml.safe_load((tempdir / 'metadata.yaml').read_text())
+    assert meta['maintainer'] == 'someone@example.com'
+    options = yaml.safe_load((tempdir / 'config.yaml').read_text())['options']
+    assert options == {'name': {'type': 'string', 'default': None,
+                                'description': 'clashes with Jinx.name'}}
+
+
+STATIC_JINX = """
+import some_module_that_is_not_installed
+from jinx import *
+
+IFACE = 'interface'
+
+
+class StaticJinx(Jinx):
+    \"\"\"docstring\"\"\"
+    name = 'my-charm'
+    summary: str = 'summary'
+    bases = [Base(run_on=[Platform('ubuntu', '22.04')],
+                  build_on=[Platform('ubuntu', '22.04')])]
+
+    db = require(IFACE)
+    disk = storage('filesystem', '/data')
+    get_data = action(dict(foo=string(default='2')))
+
+    def __init__(self, framework):
+        super().__init__(framework)
+
+    @get_data.handler
+    def _on_get_data(self, event):
+        pass
+"""
+
+
+@pytest.mark.parametrize('path', (
+        Path(__file__).absolute(),
+        Path(__file__).parents[2] / 'resources' / 'template_jinx.py'))
+def test_static_matches_import(path):
+    imported = Serializer(get_jinx_class(path))
+    static = Serializer(get_static_jinx_class(path))
+    for section in ('metadata', 'actions', 'config', 'charmcraft'):
+        assert getattr(static, section) == getattr(imported, section)
+
+
+def test_static_does_not_import():
+    path = Path(mkdtemp()) / 'charm.py'
+    path.write_text(STATIC_JINX)
+
+    serializer = Serializer(get_jinx_class(path, static=True))
+    assert serializer.metadata == {
+        'name': 'my-charm', 'summary': 'summary',
+        'requires': {'db': {'interface': 'interface'}},
+        'storage': {'disk': {'type': 'filesystem', 'location': '/data'}}}
+    assert serializer.charmcraft['bases'][0]['run-on'] == [
+        {'name': 'ubuntu', 'channel': '22.04'}]
+    assert list(serializer.actions) == ['get_data']
+
+
+def test_static_falls_back_to_import():
+    path = Path(mkdtemp()) / 'charm.py'
+    path.write_text(STATIC_JINX.replace(
+        'import some_module_that_is_not_installed', '').replace(
+        "require(IFACE)", "require(IFACE.upper())"))
+
+    with pytest.raises(Unresolvable):
+        get_static_jinx_class(path)
+    jinx = get_jinx_class(path, static=True)
+    assert Serializer(jinx).metadata['requires'] == {
+        'db': {'interface': 'INTERFACE'}}
+
+
+@pytest.mark.parametrize('old, new', (
+        # a module-level def shadows jinx's constructor
+        ("IFACE = 'interface'",
+         "IFACE = 'interface'\ndef require(iface): return None"),
+        # so does a later import of the same name
+        ('from jinx import *', 'from jinx import *\nfrom mylib import storage'),
+        # a method call on something else isn't jinx's
+        ('require(IFACE)', 'IFACE.require(IFACE)'),
+        # constants must be literals, bound before the class
+        ("IFACE = 'interface'", "IFACE = 'interface'\nIFACE = make()"),
+        ("IFACE = 'interface'", ''),
+        # a class attribute shadows the constructor in the rest of the body
+        ("    db = require(IFACE)",
+         "    require = 'x'\n    db = require(IFACE)"),
+))
+def test_static_resolves_names(old, new):
+    assert old in STATIC_JINX
+    with pytest.raises(Unresolvable):
+        get_static_jinx_class('charm.py', STATIC_JINX.replace(old, new) +
+                              "\nIFACE = 'other'\n")
+
+
+def test_static_resolves_module_imports():
+    source = STATIC_JINX.replace('from jinx import *', """
+try:
+    import jinx as j
+except ImportError:
+    import charms.jinx as j
+from jinx import Jinx, Base, Platform, string
+from charms.jinx import storage
+from jinx import action as act
+def helper(): pass
+""").replace('require(', 'j.require(').replace(' action(', ' act(')
+    serializer = Serializer(get_static_jinx_class('charm.py', source))
+    assert serializer.metadata['requires'] == {
+        'db': {'interface': 'interface'}}
+    assert list(serializer.actions) == ['get_data']
+
+
+def test_unpack_many():
+    tempdir = Path(mkdtemp())
+    template = Path(__file__).parents[2] / 'resources' / 'template_jinx.py'
+    for charm in ('good', 'other'):
+        (tempdir / charm / 'src').mkdir(parents=True)
+        (tempdir / charm / 'src' / 'charm.py').write_text(template.read_text())
+    (tempdir / 'broken' / 'src').mkdir(parents=True)
+    (tempdir / 'broken' / 'src' / 'charm.py').write_text('nope(')
+
+    jobs = expand_jobs(str(tempdir / '*' / 'src' / 'charm.py'))
+    assert [root.name for _, root in jobs] == ['broken', 'good', 'other']
+
+    results = unpack_many(jobs, processes=2, overwrite=True)
+    by_root = {r.root.name: r for r in results}
+    assert not by_root['broken'].ok
+    assert 'SyntaxError' in by_root['broken'].error
+    for charm in ('good', 'other'):
+        assert by_root[charm].ok
+        assert 'metadata.yaml' in by_root[charm].changed
+        assert yaml.safe_load(
+            (tempdir / charm / 'metadata.yaml').read_text())['name'] == 'my-charm'
+    assert report(results).endswith('2 unpacked, 1 failed')
+
+
+def test_watcher():
+    tempdir = Path(mkdtemp())
+    jinx_file = tempdir / 'my_jinx.py'
+    jinx_file.write_text(STATIC_JINX.replace(
+        'import some_module_that_is_not_installed', ''))
+    extra = tempdir / 'extra.txt'
+    extra.write_text('extra')
+
+    # the cli passes paths as str
+    watcher = Watcher(str(jinx_file), root=str(tempdir), include=str(extra))
+    assert watcher.start() == ['metadata.yaml', 'actions.yaml', 'config.yaml',
+                               'charmcraft.yaml', 'src/charm.py']
+    assert watcher.poll() == []
+
+    jinx_file.write_text(jinx_file.read_text().replace(
+        "    db = require(IFACE)",
+        "    db = require(IFACE)\n    web = provide('http')"))
+    assert watcher.poll() == ['metadata.yaml', 'src/charm.py']
+    meta = yaml.safe_load((tempdir / 'metadata.yaml').read_text())
+    assert meta['provides'] == {'web': {'interface': 'http'}}
+    assert (tempdir / 'src' / 'charm.py').read_text() == jinx_file.read_text()
+    # the previous load was replaced, not accumulated
+    assert [m for m in sys.modules if m.startswith('_jinx_charm_') and
+            getattr(sys.modules[m], '__file__', None) == str(jinx_file)] == [
+        _module_name(jinx_file)]
+
+    extra.write_text('more extra')
+    assert watcher.poll() == ['src/extra.txt']
+    assert (tempdir / 'src' / 'extra.txt').read_text() == 'more extra'
+
+
+def test_watcher_options():
+    tempdir = Path(mkdtemp())
+    jinx_file = tempdir / 'my_jinx.py'
+    jinx_file.write_text(STATIC_JINX.replace(
+        'import some_module_that_is_not_installed', ''))
+    lib = tempdir / 'mylib'
+    (lib / 'tests').mkdir(parents=True)
+    (lib / '__init__.py').write_text('X = 1\n')
+    (lib / 'tests' / 'test_lib.py').write_text('')
+
+    (tempdir / 'charm').mkdir()
+    watcher = Watcher(jinx_file, root=tempdir / 'charm', include=[lib],
+                      bundle=True, prune=True, precompile=True, link=True,
+                      write_json=True)
+    changed = watcher.start()
+    assert 'metadata.json' in changed and 'src/charm.jinx' in changed
+    src = tempdir / 'charm' / 'src'
+    assert not (src / 'mylib' / 'tests').exists()
+    assert (src / 'mylib' / '__init__.py').stat().st_ino == \
+        (lib / '__init__.py').stat().st_ino
+    assert [p.name for p in (src / 'mylib' / '__pycache__').iterdir()]
+
+    jinx_file.write_text(jinx_file.read_text().replace(
+        "    db = require(IFACE)",
+        "    db = require(IFACE)\n    web = provide('http')"))
+    assert watcher.poll() == ['metadata.yaml', 'metadata.json',
+                              'src/charm.jinx', 'src/charm.py']
+    assert list((src / '__pycache__').glob('charm.*.pyc'))
+
+
+def test_bundle(monkeypatch):
+    import jinx
+    tempdir = Path(mkdtemp())
+    template = Path(__file__).parents[2] / 'resources' / 'template_jinx.py'
+    changed = unpack(template, root=tempdir, incremental=True, bundle=True)
+    assert changed[-2:] == ['src/charm.py', 'src/charm.jinx']
+
+    charmfile = tempdir / 'src' / 'charm.py'
+    observers = get_jinx_class(template).__jinx_registry__.observers
+
+    def no_checks(method):
+        raise AssertionError(f'{method} checked again')
+
+    # with a valid bundle, loading the charm skips the observer checks
+    monkeypatch.setattr(jinx, '_check_observer', no_checks)
+    registry = load_jinx_module(charmfile).MyCharm.__jinx_registry__
+    assert registry.observers == observers
+
+    # an edited charm.py invalidates it
+    charmfile.write_text(charmfile.read_text() + '\n# edited\n')
+    with pytest.raises(AssertionError, match='checked again'):
+        load_jinx_module(charmfile)
+
+
+def test_bundle_tracks_parents_and_jinx(monkeypatch):
+    import marshal
+    import jinx
+    project = Path(mkdtemp())
+    monkeypatch.syspath_prepend(str(project))
+    base = project / 'jinx_test_base.py'
+    base.write_text("""
+from jinx import *
+
+
+class BaseJinx(Jinx):
+    name = 'my-charm'
+    db = require('interface')
+""")
+    jinx_file = project / 'charm.py'
+    jinx_file.write_text("""
+from jinx import Jinx
+import jinx_test_base
+
+
+class MyCharm(jinx_test_base.BaseJinx):
+    @jinx_test_base.BaseJinx.db.on_changed
+    def _on_db_changed(self, event):
+        pass
+""")
+    tempdir = Path(mkdtemp())
+    unpack(jinx_file, root=tempdir, include=[base], bundle=True)
+    charmfile = tempdir / 'src' / 'charm.py'
+    bundle = charmfile.with_suffix('.jinx')
+
+    def no_checks(method):
+        raise AssertionError(f'{method} checked again')
+
+    monkeypatch.setattr(jinx, '_check_observer', no_checks)
+    registry = load_jinx_module(charmfile).MyCharm.__jinx_registry__
+    assert registry.observers == (('_on_db_changed', 'db_relation_changed'),)
+
+    # built by another version of jinx
+    data = marshal.loads(bundle.read_bytes())
+    bundle.write_bytes(marshal.dumps(dict(data, jinx='other')))
+    monkeypatch.setattr(jinx, '_BUNDLES', {})
+    with pytest.raises(AssertionError, match='checked again'):
+        load_jinx_module(charmfile)
+    bundle.write_bytes(marshal.dumps(data))
+    monkeypatch.setattr(jinx, '_BUNDLES', {})
+    load_jinx_module(charmfile)
+
+    # the module defining a parent class changed
+    base.write_text(base.read_text() + '\n# edited\n')
+    monkeypatch.delitem(sys.modules, 'jinx_test_base')
+    with pytest.raises(AssertionError, match='checked again'):
+        load_jinx_module(charmfile)
+
+
+def test_unpack_in_place():
+    # the jinx already is root/src/charm.py: nothing to overwrite, but the
+    # other steps still run
+    tempdir = Path(mkdtemp())
+    (tempdir / 'src').mkdir()
+    charmfile = tempdir / 'src' / 'charm.py'
+    charmfile.write_text((Path(__file__).parents[2] / 'resources' /
+                          'template_jinx.py').read_text())
+    extra = Path(mkdtemp()) / 'extra.py'
+    extra.write_text('X = 1\n')
+
+    changed = unpack(charmfile, root=tempdir, include=[extra], bundle=True,
+                     incremental=True)
+    assert changed[-2:] == ['src/charm.jinx', 'src/extra.py']
+    assert (tempdir / 'src' / 'charm.jinx').exists()
+
+
+def test_unpack_prune_and_precompile():
+    tempdir = Path(mkdtemp())
+    lib = Path(mkdtemp()) / 'mylib'
+    (lib / 'tests').mkdir(parents=True)
+    (lib / 'docs').mkdir()
+    (lib / '__init__.py').write_text('X = 1\n')
+    (lib / 'README.md').write_text('readme')
+    (lib / 'conftest.py').write_text('')
+    (lib / 'tests' / 'test_lib.py').write_text('')
+    (lib / 'docs' / 'index.rst').write_text('')
+
+    unpack(Path(__file__).absolute(), root=tempdir, include=[lib],
+           prune=True, precompile=True)
+    src = tempdir / 'src'
+    assert sorted(p.name for p in (src / 'mylib').iterdir()) == [
+        '__init__.py', '__pycache__']
+    pyc, = (src / 'mylib' / '__pycache__').iterdir()
+    # pep 552 flags: hash-based, don't check the source
+    assert int.from_bytes(pyc.read_bytes()[4:8], 'little') == 0b01
+
+    # a later sync of the source drops its never-revalidated pyc
+    (lib / '__init__.py').write_text('X = 2\n')
+    unpack(Path(__file__).absolute(), root=tempdir, include=[lib],
+           prune=True, overwrite=True, incremental=True)
+    assert not pyc.exists()
+    out = subprocess.run([sys.executable, '-c', 'import mylib; print(mylib.X)'],
+                         cwd=src, check=True, capture_output=True, text=True)
+    assert out.stdout.strip() == '2'
+
+    # a file that doesn't compile fails the unpack
+    (lib / 'broken.py').write_text('def\n')
+    with pytest.raises(RuntimeError, match='broken.py'):
+        unpack(Path(__file__).absolute(), root=tempdir, include=[lib],
+               overwrite=True, incremental=True, precompile=True)
+
+
+def test_precompile_linked_includes():
+    tempdir = Path(mkdtemp())
+    lib = Path(mkdtemp()) / 'mylib'
+    lib.mkdir()
+    (lib / 'mod.py').write_text('X = 1\n')
+    jinx_file = Path(__file__).absolute()
+
+    def imported():
+        return subprocess.run(
+            [sys.executable, '-c', 'import mylib.mod; print(mylib.mod.X)'],
+            cwd=tempdir / 'src', check=True, capture_output=True,
+            text=True).stdout.strip()
+
+    unpack(jinx_file, root=tempdir, include=[lib], link=True,
+           precompile=True)
+    pyc, = (tempdir / 'src' / 'mylib' / '__pycache__').iterdir()
+    # pep 552 flags: hash-based, checked against the source
+    assert int.from_bytes(pyc.read_bytes()[4:8], 'little') == 0b11
+
+    # editing the original edits the linked file in place
+    (lib / 'mod.py').write_text('X = 2\n')
+    assert imported() == '2'
+    unpack(jinx_file, root=tempdir, include=[lib], link=True,
+           overwrite=True, incremental=True)
+    assert not pyc.exists()
+    assert imported() == '2'
+
+
+def test_include_skips_unchanged_and_links():
+    tempdir = Path(mkdtemp())
+    lib = Path(mkdtemp()) / 'mylib'
+    (lib / 'sub').mkdir(parents=True)
+    (lib / '__init__.py').write_text('X = 1\n')
+    (lib / 'sub' / 'mod.py').write_text('Y = 2\n')
+    jinx_file = Path(__file__).absolute()
+
+    changed = unpack(jinx_file, root=tempdir, include=[lib], incremental=True)
+    assert sorted(changed)[-2:] == ['src/mylib/__init__.py',
+                                    'src/mylib/sub/mod.py']
+    assert unpack(jinx_file, root=tempdir, include=[lib], overwrite=True,
+                  incremental=True) == []
+
+    # same size, new mtime: compared by content, not copied
+    (lib / '__init__.py').write_text('X = 1\n')
+    (lib / 'sub' / 'mod.py').write_text('Y = 3\n')
+    assert unpack(jinx_file, root=tempdir, include=[lib], overwrite=True,
+                  incremental=True) == ['src/mylib/sub/mod.py']
+    assert (tempdir / 'src' / 'mylib' / 'sub' / 'mod.py').read_text() == \
+        'Y = 3\n'
+
+    linked = Path(mkdtemp())
+    unpack(jinx_file, root=linked, include=[lib], link=True)
+    assert (linked / 'src' / 'mylib' / '__init__.py').stat().st_ino == \
+        (lib / '__init__.py').stat().st_ino
+
+
+def test_unpack_declaration_order_and_json():
+    import json
+
+    class OrderedJinx(Jinx):
+        name = 'my-charm'
+        zeta = config(string())
+        alpha = config(string())
+
+    tempdir = Path(mkdtemp())
+    changed = dump_all(OrderedJinx, tempdir, formats=('yaml', 'json'))
+    assert changed == ['metadata.yaml', 'actions.yaml', 'config.yaml',
+                       'charmcraft.yaml', 'metadata.json', 'actions.json',
+                       'config.json', 'charmcraft.json']
+    text = (tempdir / 'config.yaml').read_text()
+    # declaration order, and no aliases for the (shared) identical params
+    assert text.index('zeta:') < text.index('alpha:')
+    assert '&' not in text and '*' not in text
+    config_ = yaml.safe_load(text)
+    assert list(config_['options']) == ['zeta', 'alpha']
+    assert json.loads((tempdir / 'config.json').read_text()) == config_
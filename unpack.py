@@ -1,28 +1,56 @@
 #! /bin/python3
 
+import compileall
+import fnmatch
+import glob
+import io
+import json
+import multiprocessing
 import os
+import py_compile
 import shutil
 import stat
-from dataclasses import asdict
-from typing import Union, Type, Sequence, Optional
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import (Any, Union, Type, Sequence, Optional, List, Tuple, Dict,
+                    Set, Iterator, TextIO)
 from pathlib import Path
 
 import yaml
 
-from jinx import Jinx, Serializer
+import jinx as _jinx
+from jinx import BUNDLE_SUFFIX, Jinx, Serializer, make_bundle
 
+import ast
+import builtins
+import hashlib
 import importlib.util
 import sys
+import time
+from types import ModuleType
 
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
 
-def get_jinx_class(path_to_jinx) -> Type[Jinx]:
+
+def get_jinx_class(path_to_jinx, static: bool = False) -> Type[Jinx]:
+    """Load the Jinx subclass defined in ``path_to_jinx``.
+
+    With ``static``, first try to rebuild it from the source without
+    importing it (see get_static_jinx_class); fall back to importing the
+    file if some declaration can't be resolved that way.
+    """
     path_to_jinx = Path(path_to_jinx)
-    source = path_to_jinx.read_text()
-    spec = importlib.util.spec_from_file_location("jinx", path_to_jinx)
-    module = importlib.util.module_from_spec(spec)
-    sys.modules["module.name"] = module
-    spec.loader.exec_module(module)
+    if static:
+        try:
+            return get_static_jinx_class(path_to_jinx)
+        except Unresolvable as e:
+            print(f'cannot read {path_to_jinx} statically ({e}); importing it')
 
+    module = load_jinx_module(path_to_jinx)
     Jinx_Type = module.__dict__.get('Jinx')
     if not Jinx_Type:
         raise RuntimeError('expecting a Charm inheriting directly from Jinx, '
@@ -42,82 +70,910 @@ def get_jinx_class(path_to_jinx) -> Type[Jinx]:
     return jinx
 
 
+# name of a loaded jinx module -> modules first imported while loading it
+_LOADED = {}
+
+
+def _module_name(path_to_jinx: Path) -> str:
+    digest = hashlib.sha1(str(path_to_jinx.absolute()).encode()).hexdigest()
+    return f'_jinx_charm_{digest[:12]}'
+
+
+def load_jinx_module(path_to_jinx: Path) -> ModuleType:
+    """Execute ``path_to_jinx`` as a module.
+
+    The module is registered in sys.modules (under a name derived from its
+    path) while and after it runs, so that the jinx's classes can be looked
+    up by their __module__. Loading the same file again replaces it.
+    """
+    name = _module_name(path_to_jinx)
+    spec = importlib.util.spec_from_file_location(name, path_to_jinx)
+    module = importlib.util.module_from_spec(spec)
+    before = set(sys.modules)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    _LOADED[name] = set(sys.modules) - before - {name}
+    return module
+
+
+def _is_under(path: Path, root: Path) -> bool:
+    try:
+        path.relative_to(root)
+    except ValueError:
+        return False
+    return True
+
+
+def local_modules(path_to_jinx: Path,
+                  local_roots: Sequence[Path] = ()) -> Dict[str, Path]:
+    """Modules (name -> file) imported by the last load of ``path_to_jinx``
+    from its own directory or from ``local_roots``."""
+    roots = [path_to_jinx.absolute().parent,
+             *(Path(r).absolute() for r in local_roots)]
+    found = {}
+    for dep in _LOADED.get(_module_name(path_to_jinx), ()):
+        file = getattr(sys.modules.get(dep), '__file__', None)
+        if file and any(_is_under(Path(file), r) for r in roots):
+            found[dep] = Path(file)
+    return found
+
+
+def unload_jinx_module(path_to_jinx: Path, local_roots: Sequence[Path] = ()):
+    """Forget a module loaded by load_jinx_module.
+
+    Its local_modules are dropped too, so that the next load picks up their
+    changes; third-party packages stay imported.
+    """
+    for dep in local_modules(path_to_jinx, local_roots):
+        del sys.modules[dep]
+    sys.modules.pop(_module_name(path_to_jinx), None)
+    _LOADED.pop(_module_name(path_to_jinx), None)
+
+
+class Unresolvable(RuntimeError):
+    """A jinx declaration can't be evaluated without importing the charm."""
+
+
+# modules static mode reads as jinx (charms vendor it as charms.jinx)
+JINX_MODULES = ('jinx', 'charms.jinx')
+# callables a class body may use in static mode, by qualified name
+STATIC_CALLABLES = {f'jinx.{name}': getattr(_jinx, name) for name in (
+    'config', 'relation', 'require', 'provide', 'peer', 'container',
+    'resource', 'action', 'storage', 'Param', 'string', 'integer', 'float_',
+    'Base', 'Platform')}
+STATIC_CALLABLES['builtins.dict'] = dict
+# class attributes that don't contribute to the charm's metadata
+STATIC_IGNORED_CALLABLES = {'ops.StoredState', 'ops.framework.StoredState'}
+# what ``from jinx import *`` binds, as far as static mode is concerned
+_JINX_STAR_NAMES = ('Jinx', *(name.partition('.')[2]
+                              for name in STATIC_CALLABLES
+                              if name.startswith('jinx.')))
+
+# name -> qualified name of what it is bound to ('jinx.config'), or None
+# if static mode can't tell (a def, a computed value, a star import...)
+Bindings = Dict[str, Optional[str]]
+
+
+def _stored_names(node: ast.AST) -> Iterator[str]:
+    for sub in ast.walk(node):
+        if isinstance(sub, ast.Name) and isinstance(sub.ctx,
+                                                    (ast.Store, ast.Del)):
+            yield sub.id
+
+
+def _canonical(name: str) -> str:
+    """The qualified ``name`` with the jinx module spelled ``jinx``."""
+    for module in JINX_MODULES:
+        if name == module or name.startswith(module + '.'):
+            return 'jinx' + name[len(module):]
+    return name
+
+
+def _rebind(name: str, bindings: Bindings, constants: dict,
+            target: Optional[str] = None):
+    """``name`` is now bound to ``target`` (None: to something unknown)."""
+    bindings[name] = target and _canonical(target)
+    constants.pop(name, None)
+
+
+def _bind(stmts: Sequence[ast.stmt], bindings: Bindings, constants: dict):
+    """Update ``bindings`` and ``constants`` (names bound to literals) with
+    what running the module-level ``stmts`` would bind, in order."""
+    for stmt in stmts:
+        if isinstance(stmt, ast.ImportFrom):
+            module = stmt.module if not stmt.level else None
+            for alias in stmt.names:
+                if alias.name != '*':
+                    _rebind(alias.asname or alias.name, bindings, constants,
+                            module and f'{module}.{alias.name}')
+                elif module in JINX_MODULES:
+                    for name in _JINX_STAR_NAMES:
+                        _rebind(name, bindings, constants, f'jinx.{name}')
+                else:  # may bind anything
+                    for name in (*_JINX_STAR_NAMES, 'dict', 'StoredState'):
+                        _rebind(name, bindings, constants)
+        elif isinstance(stmt, ast.Import):
+            for alias in stmt.names:
+                top = alias.name.partition('.')[0]
+                _rebind(alias.asname or top, bindings, constants,
+                        alias.name if alias.asname else top)
+        elif isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef,
+                               ast.ClassDef)):
+            _rebind(stmt.name, bindings, constants)
+        elif isinstance(stmt, (ast.Assign, ast.AnnAssign, ast.AugAssign,
+                               ast.Delete)):
+            targets = getattr(stmt, 'targets', None) or [stmt.target]
+            for target in targets:
+                for name in _stored_names(target):
+                    _rebind(name, bindings, constants)
+            if (isinstance(stmt, (ast.Assign, ast.AnnAssign))
+                    and stmt.value is not None and len(targets) == 1
+                    and isinstance(targets[0], ast.Name)):
+                try:
+                    constants[targets[0].id] = ast.literal_eval(stmt.value)
+                except (ValueError, TypeError):
+                    pass
+        elif isinstance(stmt, (ast.If, ast.Try, ast.For, ast.AsyncFor,
+                               ast.While, ast.With, ast.AsyncWith)):
+            _bind_branches(stmt, bindings, constants)
+
+
+def _bind_branches(stmt: ast.stmt, bindings: Bindings, constants: dict):
+    """_bind for a compound statement; a name its branches bind to
+    different things becomes unknown."""
+    if isinstance(stmt, ast.Try):
+        branches = [stmt.body + stmt.orelse] + [
+            handler.body for handler in stmt.handlers]
+    else:
+        branches = [stmt.body, getattr(stmt, 'orelse', [])]
+    outcomes = []
+    for branch in branches:
+        outcome = dict(bindings), dict(constants)
+        _bind(branch, *outcome)
+        outcomes.append(outcome)
+
+    def state(outcome, name):
+        names, values = outcome
+        return (names.get(name, ''),
+                repr(values[name]) if name in values else '')
+
+    updates = []
+    for name in {name for outcome in outcomes for part in outcome
+                 for name in part}:
+        before = state((bindings, constants), name)
+        changed = {state(outcome, name): outcome for outcome in outcomes
+                   if state(outcome, name) != before}
+        if len(changed) > 1:
+            updates.append((name, None, {}))
+        elif changed:
+            new_names, new_values = next(iter(changed.values()))
+            updates.append((name, new_names.get(name), new_values))
+    for name, target, values in updates:
+        _rebind(name, bindings, constants, target)
+        if name in values:
+            constants[name] = values[name]
+
+    # loop and with targets and exception names are bound too
+    nodes = [getattr(stmt, 'target', None)] + [
+        item.optional_vars for item in getattr(stmt, 'items', ())]
+    for node in filter(None, nodes):
+        for name in _stored_names(node):
+            _rebind(name, bindings, constants)
+    for handler in getattr(stmt, 'handlers', ()):
+        if handler.name:
+            _rebind(handler.name, bindings, constants)
+    _bind(getattr(stmt, 'finalbody', []), bindings, constants)
+
+
+class _StaticEvaluator:
+    def __init__(self, constants: dict, bindings: Bindings):
+        self.constants = constants
+        self.bindings = bindings
+
+    def shadow(self, name: str):
+        """``name`` was (re)bound in the class body."""
+        self.bindings[name] = None
+        self.constants.pop(name, None)
+
+    def eval(self, node: ast.AST):
+        try:
+            return ast.literal_eval(node)
+        except (ValueError, TypeError):
+            pass
+
+        if isinstance(node, ast.Name) and node.id in self.constants:
+            return self.constants[node.id]
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            items = [self.eval(elt) for elt in node.elts]
+            return {ast.List: list, ast.Tuple: tuple,
+                    ast.Set: set}[type(node)](items)
+        if isinstance(node, ast.Dict):
+            if None in node.keys:
+                raise Unresolvable('dict unpacking')
+            return {self.eval(k): self.eval(v)
+                    for k, v in zip(node.keys, node.values)}
+        if isinstance(node, ast.Call):
+            func = STATIC_CALLABLES.get(self.resolve(node.func))
+            if func is None or any(isinstance(a, ast.Starred)
+                                   for a in node.args) or any(
+                    kw.arg is None for kw in node.keywords):
+                raise Unresolvable(f'call to {ast.dump(node.func)}')
+            return func(*(self.eval(a) for a in node.args),
+                        **{kw.arg: self.eval(kw.value)
+                           for kw in node.keywords})
+        raise Unresolvable(f'expression {ast.dump(node)}')
+
+    def resolve(self, node: ast.expr) -> Optional[str]:
+        """The qualified name ``node`` refers to (``'jinx.config'`` for
+        ``config`` after ``from jinx import *``), if static mode can tell."""
+        attrs = []
+        while isinstance(node, ast.Attribute):
+            attrs.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name):
+            return None
+        if node.id in self.bindings:
+            base = self.bindings[node.id]
+        elif hasattr(builtins, node.id):
+            base = f'builtins.{node.id}'
+        else:
+            return None
+        if base is None:
+            return None
+        return _canonical('.'.join([base, *reversed(attrs)]))
+
+
+def get_static_jinx_class(path_to_jinx,
+                          source: Optional[str] = None) -> Type[Jinx]:
+    """Rebuild the Jinx subclass in ``path_to_jinx`` from its source alone.
+
+    Only literals, module-level literal constants and calls to the jinx
+    declaration constructors are evaluated, with names resolved as the
+    module binds them before the class; the charm module (and whatever it
+    imports) is never executed. Raises Unresolvable if the class body has
+    anything else that could affect the metadata. ``source`` is used
+    instead of the file's contents if given.
+    """
+    path_to_jinx = Path(path_to_jinx)
+    if source is None:
+        source = path_to_jinx.read_text()
+    tree = ast.parse(source, str(path_to_jinx))
+
+    bindings: Bindings = {}
+    constants = {}
+    classes = []
+    for stmt in tree.body:
+        if isinstance(stmt, ast.ClassDef) and any(
+                _StaticEvaluator({}, bindings).resolve(b) == 'jinx.Jinx'
+                for b in stmt.bases):
+            # the class body sees what the module bound so far
+            classes.append((stmt, dict(bindings), dict(constants)))
+        _bind([stmt], bindings, constants)
+
+    if not classes:
+        raise Unresolvable('no class inheriting directly from Jinx')
+    if len(classes) > 1:
+        raise RuntimeError(f'multiple jinxes found in {path_to_jinx}: '
+                           f'{", ".join(c.name for c, *_ in classes)}')
+    (classdef, bindings, constants), = classes
+    if len(classdef.bases) > 1 or classdef.keywords:
+        raise Unresolvable(f'{classdef.name} has other bases or keywords')
+
+    evaluator = _StaticEvaluator(constants, bindings)
+    namespace = {'__module__': f'jinx.static.{path_to_jinx.stem}',
+                 '__qualname__': classdef.name}
+    for stmt in classdef.body:
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef,
+                             ast.Pass)) or (
+                isinstance(stmt, ast.Expr) and
+                isinstance(stmt.value, ast.Constant)):
+            # methods and docstrings; action handlers are not metadata
+            if not isinstance(stmt, (ast.Expr, ast.Pass)):
+                evaluator.shadow(stmt.name)
+            continue
+        if isinstance(stmt, ast.AnnAssign) and stmt.value is None:
+            continue
+        if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1:
+            target, value = stmt.targets[0], stmt.value
+        elif isinstance(stmt, ast.AnnAssign):
+            target, value = stmt.target, stmt.value
+        else:
+            raise Unresolvable(f'statement at line {stmt.lineno}')
+        if not isinstance(target, ast.Name):
+            raise Unresolvable(f'assignment at line {stmt.lineno}')
+        if not (isinstance(value, ast.Call) and evaluator.resolve(
+                value.func) in STATIC_IGNORED_CALLABLES):
+            namespace[target.id] = evaluator.eval(value)
+        evaluator.shadow(target.id)
+
+    return type(classdef.name, (Jinx,), namespace)
+
+
 LIC_HEADER = """# Copyright 2022 Canonical Ltd.
 # See LICENSE file for licensing details.\n\n"""
 
 
-def dump_metadata(serializer: Serializer, root: Path, license: str):
-    (root / 'metadata.yaml').write_text(license + yaml.safe_dump(serializer.metadata))
+def write_if_changed(path: Path, content: Union[str, bytes]) -> bool:
+    """Atomically replace ``path`` with ``content`` unless it already has it.
 
+    Returns whether the file was written.
+    """
+    data = content.encode() if isinstance(content, str) else content
+    try:
+        if path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    tmp = path.with_name(f'.{path.name}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return True
 
-def dump_actions(serializer: Serializer, root: Path, license: str):
-    (root / 'actions.yaml').write_text(license + yaml.safe_dump(serializer.actions))
 
+class _Dumper(getattr(yaml, 'CSafeDumper', yaml.SafeDumper)):
+    """Safe dumper, libyaml's if available, that never writes aliases
+    (the metadata jinx interns is shared between declarations)."""
 
-def dump_charmcraft(serializer: Serializer, root: Path, license: str):
-    (root / 'charmcraft.yaml').write_text(license + yaml.safe_dump(serializer.charmcraft))
+    def ignore_aliases(self, data):
+        return True
 
 
-def dump_config(serializer: Serializer, root: Path, license: str):
-    (root / 'config.yaml').write_text(license + yaml.safe_dump(serializer.config))
+def write_section(f: TextIO, data: Any, license: str = LIC_HEADER,
+                  format: str = 'yaml'):
+    """Stream ``data`` to ``f`` as yaml (after ``license``) or json, keys
+    in declaration order."""
+    if format == 'json':
+        json.dump(data, f, indent=2)
+        f.write('\n')
+    else:
+        f.write(license)
+        yaml.dump(data, f, Dumper=_Dumper, sort_keys=False,
+                  default_flow_style=False)
+
+
+def _dump(path: Path, data: Any, license: str, incremental: bool,
+          format: str = 'yaml') -> bool:
+    if incremental:
+        buffer = io.StringIO()
+        write_section(buffer, data, license, format)
+        return write_if_changed(path, buffer.getvalue())
+    with open(path, 'w') as f:
+        write_section(f, data, license, format)
+    return True
+
+
+def dump_metadata(serializer: Serializer, root: Path, license: str,
+                  incremental: bool = False, format: str = 'yaml') -> bool:
+    return _dump(root / f'metadata.{format}', serializer.metadata, license,
+                 incremental, format)
+
+
+def dump_actions(serializer: Serializer, root: Path, license: str,
+                 incremental: bool = False, format: str = 'yaml') -> bool:
+    return _dump(root / f'actions.{format}', serializer.actions, license,
+                 incremental, format)
+
+
+def dump_charmcraft(serializer: Serializer, root: Path, license: str,
+                    incremental: bool = False, format: str = 'yaml') -> bool:
+    return _dump(root / f'charmcraft.{format}', serializer.charmcraft,
+                 license, incremental, format)
+
+
+def dump_config(serializer: Serializer, root: Path, license: str,
+                incremental: bool = False, format: str = 'yaml') -> bool:
+    return _dump(root / f'config.{format}', serializer.config, license,
+                 incremental, format)
+
+
+DUMPERS = (('metadata', dump_metadata),
+           ('actions', dump_actions),
+           ('config', dump_config),
+           ('charmcraft', dump_charmcraft))
 
 
 def unpack(path_to_jinx: Union[str, Path], root: Union[str, Path] = None,
            license: str = LIC_HEADER, overwrite=False,
-           include: Optional[Union[str, Sequence[Union[str, Path]]]] = None):
-    if include is None:
-        include = ()
-    if isinstance(include, str):
-        include = include.split(';')
+           include: Optional[Union[str, Sequence[Union[str, Path]]]] = None,
+           incremental: bool = False, static: bool = False,
+           bundle: bool = False, prune: bool = False,
+           precompile: bool = False, link: bool = False,
+           write_json: bool = False) -> List[str]:
+    """Write the charm files for the jinx at ``path_to_jinx`` into ``root``.
 
-    root = (root or Path()).absolute()
+    With ``incremental``, files whose content is already up to date are left
+    untouched (mtime included). Returns the paths, relative to ``root``, of
+    the artifacts that were (re)written. ``static`` reads the jinx without
+    importing it where possible; see get_jinx_class. ``bundle`` also writes
+    src/charm.jinx; see dump_bundle. ``prune`` leaves tests and docs out of
+    included directories, ``link`` hardlinks included files instead of
+    copying them and ``precompile`` byte-compiles src/ afterwards; see
+    include_paths and precompile_src. ``write_json`` also writes the
+    sections as json files (metadata.json, ...) for tools that read them in
+    bulk.
+    """
+    include = _split_include(include)
+    root = Path(root or Path()).absolute()
     path_to_jinx = Path(path_to_jinx).absolute()
 
-    jinx = get_jinx_class(path_to_jinx)
-    serializer = Serializer(jinx)
-    dump_metadata(serializer, root, license)
-    dump_actions(serializer, root, license)
-    dump_config(serializer, root, license)
-    dump_charmcraft(serializer, root, license)
+    formats = ('yaml', 'json') if write_json else ('yaml',)
+    changed = dump_all(get_jinx_class(path_to_jinx, static), root, license,
+                       incremental, formats)
 
     src = root / 'src'
     charmfile = src / 'charm.py'
 
     if src.exists() and src.is_dir():
-        if charmfile.exists():
-            if not overwrite:
-                print(
-                    'found existing /src/charm.py. pass --overwrite to overwrite')
-                return
+        # the jinx may be src/charm.py itself, as in the default layout
+        if charmfile.exists() and not overwrite and (
+                path_to_jinx.resolve() != charmfile.resolve()):
+            print('found existing /src/charm.py. pass --overwrite to overwrite')
+            return changed
     elif not src.exists():
         os.mkdir(src)
     else:
         # src is a file
         print('expected /src directory; found a "src" file!')
-        return
+        return changed
 
-    if path_to_jinx.absolute() != charmfile.absolute():
-        shutil.copy2(path_to_jinx, charmfile)
+    if copy_charm(path_to_jinx, charmfile, incremental):
+        changed.append('src/charm.py')
+    if bundle and dump_bundle(path_to_jinx, charmfile, incremental):
+        changed.append('src/' + charmfile.with_suffix(BUNDLE_SUFFIX).name)
 
-    for name in include:
-        pth = Path(name)
-        if pth.is_dir():
-            shutil.copytree(pth, src)
-        else:
-            shutil.copy2(pth, src)
-        print(f'included {name}')
+    for dest in include_paths([Path(name) for name in include], src, prune,
+                              link):
+        changed.append(str(dest.relative_to(root)))
+    if precompile:
+        precompile_src(src)
+    return changed
+
+
+def _split_include(include) -> Sequence[Union[str, Path]]:
+    if include is None:
+        return ()
+    if isinstance(include, str):
+        return include.split(';')
+    return include
+
+
+def dump_all(jinx: Type[Jinx], root: Path, license: str = LIC_HEADER,
+             incremental: bool = False,
+             formats: Sequence[str] = ('yaml',)) -> List[str]:
+    """Write all yaml (and/or json) files for ``jinx``; returns those that
+    were written."""
+    serializer = Serializer(jinx)
+    return [f'{section}.{format}' for format in formats
+            for section, dump in DUMPERS
+            if dump(serializer, root, license, incremental, format)]
+
+
+def copy_charm(path_to_jinx: Path, charmfile: Path,
+               incremental: bool = False) -> bool:
+    """Copy the jinx to src/charm.py and make it executable."""
+    copied = False
+    if path_to_jinx.resolve() != charmfile.resolve():
+        if not (incremental and charmfile.exists() and
+                charmfile.read_bytes() == path_to_jinx.read_bytes()):
+            shutil.copy2(path_to_jinx, charmfile)
+            drop_bytecode(charmfile)
+            copied = True
 
     # ensure charmfile is executable
     st = os.stat(charmfile)
-    os.chmod(charmfile, st.st_mode | stat.S_IEXEC)
+    if not st.st_mode & stat.S_IEXEC:
+        os.chmod(charmfile, st.st_mode | stat.S_IEXEC)
+    return copied
+
+
+def dump_bundle(path_to_jinx: Path, charmfile: Path,
+                incremental: bool = False) -> bool:
+    """Write the precomputed registry of the jinx next to ``charmfile``.
+
+    Jinx classes loaded from ``charmfile`` then skip validating their
+    observers at import. This needs the real classes, so the jinx is
+    imported even if it was unpacked statically.
+    """
+    module = sys.modules.get(_module_name(path_to_jinx.absolute()))
+    if module is None:
+        module = load_jinx_module(path_to_jinx)
+    classes = [obj for obj in vars(module).values()
+               if isinstance(obj, type) and issubclass(obj, Jinx)
+               and obj.__module__ == module.__name__]
+    data = make_bundle(charmfile.read_bytes(), classes)
+    path = charmfile.with_suffix(BUNDLE_SUFFIX)
+    if incremental:
+        return write_if_changed(path, data)
+    path.write_bytes(data)
+    return True
+
+
+# what prune leaves out of included directories
+PRUNED_DIRS = frozenset({'tests', 'test', 'docs', 'doc', '__pycache__',
+                         '.git', '.tox', '.pytest_cache'})
+PRUNED_FILES = ('test_*.py', '*_test.py', 'conftest.py', '*.md', '*.rst',
+                '*.pyc')
+
+
+def _pruned(directory: str, names: List[str]) -> Set[str]:
+    """copytree ignore callback dropping tests, docs and caches."""
+    return {name for name in names
+            if (name in PRUNED_DIRS
+                and os.path.isdir(os.path.join(directory, name)))
+            or any(fnmatch.fnmatch(name, pattern) for pattern in PRUNED_FILES)}
+
+
+def _include_pairs(pth: Path, src: Path,
+                   prune: bool) -> Iterator[Tuple[Path, Path]]:
+    """(source, destination) of the files to include, making the dirs."""
+    if not pth.is_dir():
+        yield pth, src / pth.name
+        return
+    for directory, dirnames, filenames in os.walk(pth):
+        if prune:
+            pruned = _pruned(directory, dirnames + filenames)
+            dirnames[:] = [d for d in dirnames if d not in pruned]
+            filenames = [f for f in filenames if f not in pruned]
+        target = src / pth.name / os.path.relpath(directory, pth)
+        target.mkdir(parents=True, exist_ok=True)
+        for name in filenames:
+            yield Path(directory, name), target / name
+
+
+def _same_content(a: Path, b: Path) -> bool:
+    with open(a, 'rb') as fa, open(b, 'rb') as fb:
+        while True:
+            chunk = fa.read(1 << 20)
+            if chunk != fb.read(1 << 20):
+                return False
+            if not chunk:
+                return True
+
+
+def _copy_file(source: Path, dest: Path):
+    """Copy data and metadata, with copy_file_range where possible (which
+    lets filesystems like btrfs or xfs share the blocks instead)."""
+    with open(source, 'rb') as fsrc, open(dest, 'wb') as fdst:
+        copy_range = getattr(os, 'copy_file_range', None)
+        try:
+            if copy_range is None:
+                raise OSError
+            while copy_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                pass
+        except OSError:
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+            shutil.copyfileobj(fsrc, fdst, 1 << 20)
+    shutil.copystat(source, dest)
+
+
+def sync_file(source: Path, dest: Path, link: bool = False) -> bool:
+    """Make ``dest`` a copy of ``source``, unless it already is one.
+
+    Unchanged files are recognized by size and mtime, or, if only the mtime
+    differs, by content (then just the mtime is updated). With ``link``,
+    ``dest`` becomes a hardlink to ``source`` where the filesystem allows;
+    note that editing either then edits both. Returns whether data was
+    copied or linked.
+    """
+    st = source.stat()
+    try:
+        dst = dest.stat()
+    except FileNotFoundError:
+        dst = None
+    if dst is not None:
+        if (dst.st_ino, dst.st_dev) == (st.st_ino, st.st_dev):
+            # linked already, but maybe edited in place since precompiled
+            drop_bytecode(dest, older_than=st.st_mtime_ns)
+            return False
+        if dst.st_size == st.st_size:
+            if dst.st_mtime_ns == st.st_mtime_ns:
+                return False
+            if _same_content(source, dest):
+                shutil.copystat(source, dest)
+                return False
+
+    tmp = dest.with_name(f'.{dest.name}.tmp')
+    if link:
+        try:
+            os.link(source, tmp)
+        except OSError:  # e.g. another filesystem
+            link = False
+    if not link:
+        _copy_file(source, tmp)
+    os.replace(tmp, dest)
+    drop_bytecode(dest)
+    return True
+
+
+def include_paths(paths: Sequence[Path], src: Path, prune: bool = False,
+                  link: bool = False,
+                  workers: Optional[int] = None) -> List[Path]:
+    """Copy files into src/, and directories to src/<their name>.
+
+    Files are synced concurrently on a thread pool; those already up to
+    date are skipped (see sync_file). Returns the destinations written.
+    """
+    pairs = [pair for pth in paths for pair in _include_pairs(pth, src, prune)]
+    with ThreadPoolExecutor(workers) as pool:
+        written = list(pool.map(lambda pair: sync_file(*pair, link=link),
+                                pairs))
+    for pth in paths:
+        print(f'included {pth}')
+    return [dest for (_, dest), done in zip(pairs, written) if done]
+
+
+def include_path(pth: Path, src: Path, prune: bool = False):
+    """Copy a file into src/, or a directory to src/<its name>."""
+    include_paths([pth], src, prune)
+
+
+def drop_bytecode(path: Path, older_than: Optional[int] = None):
+    """Remove the cached bytecode of the python file at ``path``.
+
+    Pycs written by precompile_src are never checked against their source,
+    so they must go whenever the source is replaced. With ``older_than``
+    (an mtime in ns), only pycs older than that are removed.
+    """
+    if path.suffix == '.py':
+        for pyc in path.parent.glob(f'__pycache__/{path.stem}.*.pyc'):
+            if older_than is None or pyc.stat().st_mtime_ns < older_than:
+                pyc.unlink()
+
+
+def precompile_src(src: Path):
+    """Byte-compile everything under ``src`` for the running python.
+
+    The pycs are unchecked-hash ones: deterministic (no mtimes inside) and
+    never revalidated against their source, so the first hook doesn't have
+    to compile anything. Rerun it whenever src/ changes, and unpack with the
+    python version the charm runs on. Files hardlinked elsewhere (see
+    sync_file) can be edited in place, so theirs are checked-hash pycs,
+    revalidated at import. Raises RuntimeError if a file doesn't compile.
+    """
+    mode = py_compile.PycInvalidationMode
+    failed = []
+    for path in sorted(src.rglob('*.py')):
+        linked = path.stat().st_nlink > 1
+        if not compileall.compile_file(
+                str(path), quiet=1,
+                invalidation_mode=mode.CHECKED_HASH if linked
+                else mode.UNCHECKED_HASH):
+            failed.append(str(path.relative_to(src)))
+    if failed:
+        raise RuntimeError(f'cannot byte-compile {", ".join(failed)}')
+
+
+class Watcher:
+    """Keeps a charm up to date with its jinx and included files.
+
+    Inputs are polled by mtime and size; if inotify_simple is installed,
+    the wait between polls ends as soon as one of their directories
+    changes. Only the steps whose inputs changed are redone: the yaml
+    files (and the bundle) when the jinx or a local module it imports
+    changed, src/charm.py when the jinx did, and each changed include;
+    then src/ is precompiled again if anything in it changed. The other
+    arguments are as for unpack, which is always incremental here.
+    """
+
+    def __init__(self, path_to_jinx: Union[str, Path],
+                 root: Union[str, Path] = None, license: str = LIC_HEADER,
+                 include: Optional[Union[str, Sequence[Union[str, Path]]]] = None,
+                 static: bool = False, bundle: bool = False,
+                 prune: bool = False, precompile: bool = False,
+                 link: bool = False, write_json: bool = False):
+        self.path_to_jinx = Path(path_to_jinx).absolute()
+        self.root = Path(root or Path()).absolute()
+        self.license = license
+        self.include = [Path(i).absolute() for i in _split_include(include)]
+        self.static = static
+        self.bundle = bundle
+        self.prune = prune
+        self.precompile = precompile
+        self.link = link
+        self.formats = ('yaml', 'json') if write_json else ('yaml',)
+        self._deps = set()
+        self._stamps = {}
+
+    def _inputs(self) -> Iterator[Path]:
+        yield self.path_to_jinx
+        yield from self._deps
+        for pth in self.include:
+            if pth.is_dir():
+                yield from (p for p in pth.rglob('*') if p.is_file())
+            else:
+                yield pth
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        stamps = {}
+        for pth in self._inputs():
+            try:
+                st = pth.stat()
+            except FileNotFoundError:
+                continue
+            stamps[pth] = (st.st_mtime_ns, st.st_size)
+        return stamps
+
+    def _load(self) -> Type[Jinx]:
+        unload_jinx_module(self.path_to_jinx, self.include)
+        jinx = get_jinx_class(self.path_to_jinx, self.static)
+        self._deps = set(local_modules(self.path_to_jinx,
+                                       self.include).values())
+        return jinx
+
+    def _dump(self) -> List[str]:
+        """Rewrite the yaml (and json) files and the bundle, if changed."""
+        changed = dump_all(self._load(), self.root, self.license,
+                           incremental=True, formats=self.formats)
+        charmfile = self.root / 'src' / 'charm.py'
+        if self.bundle and dump_bundle(self.path_to_jinx, charmfile,
+                                       incremental=True):
+            changed.append('src/' + charmfile.with_suffix(BUNDLE_SUFFIX).name)
+        return changed
+
+    def start(self) -> List[str]:
+        """Unpack the charm (overwriting src/charm.py) and record inputs."""
+        src = self.root / 'src'
+        src.mkdir(exist_ok=True)
+        # the bundle is made from src/charm.py, so copy it first
+        copied = copy_charm(self.path_to_jinx, src / 'charm.py',
+                            incremental=True)
+        changed = self._dump()
+        if copied:
+            changed.append('src/charm.py')
+        include_paths(self.include, src, self.prune, self.link)
+        if self.precompile:
+            precompile_src(src)
+        self._stamps = self._scan()
+        return changed
+
+    def poll(self) -> List[str]:
+        """Redo what the changes since the last poll require."""
+        stamps = self._scan()
+        modified = {p for p in stamps.keys() | self._stamps.keys()
+                    if stamps.get(p) != self._stamps.get(p)}
+        if not modified:
+            return []
+        self._stamps = stamps
+
+        changed = []
+        src = self.root / 'src'
+        copied = self.path_to_jinx in modified and copy_charm(
+            self.path_to_jinx, src / 'charm.py', incremental=True)
+        if modified & ({self.path_to_jinx} | self._deps):
+            changed += self._dump()
+        if copied:
+            changed.append('src/charm.py')
+        touched = [pth for pth in self.include
+                   if any(p == pth or _is_under(p, pth) for p in modified)]
+        if touched:
+            include_paths(touched, src, self.prune, self.link)
+            changed += [f'src/{pth.name}' for pth in touched]
+        if self.precompile and (copied or touched):
+            precompile_src(src)
+        # the reload may have changed the set of local dependencies
+        self._stamps = self._scan()
+        return changed
+
+    def _wait(self, interval: float):
+        if inotify_simple is None:
+            time.sleep(interval)
+            return
+        flags = inotify_simple.flags
+        with inotify_simple.INotify() as inotify:
+            mask = (flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE |
+                    flags.DELETE)
+            for directory in {p.parent for p in self._stamps}:
+                inotify.add_watch(directory, mask)
+            inotify.read(timeout=int(interval * 1000))
+
+    def run(self, interval: float = 0.5):
+        """Watch forever (until interrupted)."""
+        print(f'unpacked {self.path_to_jinx}: '
+              f'{", ".join(self.start()) or "no changes"}')
+        while True:
+            self._wait(interval)
+            try:
+                changed = self.poll()
+            except Exception:
+                traceback.print_exc()
+                continue
+            if changed:
+                print(f'regenerated {", ".join(changed)}')
+
+
+@dataclass
+class UnpackResult:
+    path_to_jinx: Path
+    root: Path
+    changed: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def default_root(path_to_jinx: Path) -> Path:
+    """Charm root for a jinx: the parent of src/ if it lives there."""
+    parent = path_to_jinx.absolute().parent
+    return parent.parent if parent.name == 'src' else parent
+
+
+def expand_jobs(patterns: Union[str, Sequence[str]]) -> List[Tuple[Path, Path]]:
+    """Turn ``glob[=root]`` entries into (path_to_jinx, root) pairs.
+
+    ``patterns`` may also be a semicolon-separated string. Without an
+    explicit root, each match gets its default_root.
+    """
+    if isinstance(patterns, str):
+        patterns = patterns.split(';')
+    jobs = []
+    for entry in patterns:
+        pattern, _, root = entry.partition('=')
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches:
+            raise FileNotFoundError(f'{pattern} matches no file')
+        if root and len(matches) > 1:
+            raise ValueError(f'{pattern} matches {len(matches)} files but '
+                             f'only one root was given')
+        jobs.extend((Path(m), Path(root) if root else default_root(Path(m)))
+                    for m in matches)
+    return jobs
+
+
+def _unpack_job(job) -> UnpackResult:
+    path_to_jinx, root, kwargs = job
+    result = UnpackResult(path_to_jinx, root)
+    try:
+        result.changed = unpack(path_to_jinx, root, **kwargs)
+    except Exception:
+        result.error = traceback.format_exc()
+    return result
+
+
+def unpack_many(jobs: Sequence[Tuple[Union[str, Path], Union[str, Path]]],
+                processes: Optional[int] = None,
+                **kwargs) -> List[UnpackResult]:
+    """Unpack many (path_to_jinx, root) pairs in a process pool.
+
+    Every charm is unpacked in a fresh worker process, since loading a jinx
+    pollutes sys.modules. ``kwargs`` are passed on to unpack. Failures are
+    reported in the results rather than raised.
+    """
+    tasks = [(Path(path), Path(root), kwargs) for path, root in jobs]
+    with multiprocessing.Pool(processes, maxtasksperchild=1) as pool:
+        return pool.map(_unpack_job, tasks, chunksize=1)
+
+
+def report(results: Sequence[UnpackResult]) -> str:
+    lines = []
+    for result in results:
+        if result.ok:
+            changed = ', '.join(result.changed) or 'no changes'
+            lines.append(f'ok      {result.path_to_jinx} -> {result.root} '
+                         f'({changed})')
+        else:
+            error = result.error.strip().splitlines()[-1]
+            lines.append(f'FAILED  {result.path_to_jinx}: {error}')
+    failed = sum(not r.ok for r in results)
+    lines.append(f'{len(results) - failed} unpacked, {failed} failed')
+    return '\n'.join(lines)
 
 
 if __name__ == '__main__':
-    from typer import run, Argument, Option
+    from typer import run, Argument, BadParameter, Exit, Option
+
     def _unpack(
             path_to_jinx: str = Argument(
                 ...,
-                help='path to a file containing a Jinx.'),
+                help='path to a file containing a Jinx; with --batch, '
+                     'a semicolon-separated list of glob[=root] entries.'),
             root: str = Option(
                 None, help="path to charm root folder. "
                            "If left blank, we'll take it to be ./."),
@@ -131,7 +987,73 @@ if __name__ == '__main__':
             include: Optional[str] = Option(
                 None, help='semicolon-separated list of files and '
                            'directories to copy along with the '
-                           'jinx to the root/src.')):
-        unpack(path_to_jinx, root, license, overwrite, include)
+                           'jinx to the root/src.'),
+            incremental: bool = Option(
+                False, help='only rewrite files whose content changed, '
+                            'and report which ones did.'),
+            static: bool = Option(
+                False, help='read the jinx declarations from the source '
+                            'without importing it, where possible.'),
+            batch: bool = Option(
+                False, help='unpack every jinx matched by path_to_jinx in '
+                            'parallel. Roots default to the parent of '
+                            'src/ (or of the jinx file); --root is not '
+                            'allowed.'),
+            prune: bool = Option(
+                False, help='leave tests, docs and caches out of included '
+                            'directories.'),
+            link: bool = Option(
+                False, help='hardlink included files instead of copying '
+                            'them, where possible. Editing them in src/ '
+                            'then edits the originals.'),
+            precompile: bool = Option(
+                False, help='byte-compile src/ (unchecked-hash pycs) for '
+                            'the python running unpack.'),
+            bundle: bool = Option(
+                False, help='also write src/charm.jinx, a precomputed '
+                            'registry the charm loads instead of '
+                            'rebuilding it at every hook.'),
+            write_json: bool = Option(
+                False, '--json',
+                help='also write metadata.json, config.json, ... for '
+                     'tools that read these in bulk.'),
+            processes: Optional[int] = Option(
+                None, help='number of worker processes for --batch.'),
+            watch: bool = Option(
+                False, help='keep running and regenerate the charm whenever '
+                            'the jinx or an included file changes. '
+                            'Implies --overwrite and --incremental.')):
+        if watch:
+            if batch:
+                raise BadParameter('can only watch one jinx',
+                                   param_hint='--batch')
+            try:
+                Watcher(path_to_jinx, root, license, include, static,
+                        bundle, prune, precompile, link, write_json).run()
+            except KeyboardInterrupt:
+                pass
+            return
+
+        if batch:
+            if root is not None:
+                raise BadParameter('roots come from the glob=root entries '
+                                   'with --batch', param_hint='--root')
+            results = unpack_many(
+                expand_jobs(path_to_jinx), processes, license=license,
+                overwrite=overwrite, include=include,
+                incremental=incremental, static=static, bundle=bundle,
+                prune=prune, precompile=precompile, link=link,
+                write_json=write_json)
+            print(report(results))
+            if not all(r.ok for r in results):
+                raise Exit(1)
+            return
+
+        changed = unpack(path_to_jinx, root, license, overwrite, include,
+                         incremental, static, bundle, prune, precompile,
+                         link, write_json)
+        if incremental:
+            print('changed: ' + ', '.join(changed) if changed
+                  else 'no changes')
 
     run(_unpack)